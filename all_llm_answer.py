@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
+import json
+import asyncio
 import pandas as pd
 from glob import glob
 from typing import List, Optional, Tuple, Dict
@@ -15,10 +17,16 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from prompt.V2 import TCFD_LLM_ANSWER_PROMPT
 from ollama import chat
+from ollama import AsyncClient
 from ollama import ChatResponse
+from async_llm_engine import AsyncJudgeEngine, Job, RateLimiter
+from llm_cache import LLMResponseCache
+from result_store import dims_dir_of, load_results, write_results
 
 INPUT_DIR = "data/TCFD_report_improved_query_result"
-INPUT_PATTERN = "*_output_chunks.csv"
+# "csv" 或 "parquet"（query_all_report.py 的 OUTPUT_FORMAT）；輸出沿用輸入的格式
+INPUT_FORMAT = "csv"
+INPUT_PATTERN = f"*_output_chunks.{INPUT_FORMAT}"
 POS_EXAMPLE_SOURCE = (
     "data/temp/富邦金控_2023_output_chunks_fewshot_with_CoT_v1_few_shot.csv"
 )
@@ -26,10 +34,27 @@ POS_EXAMPLE_SOURCE = (
 GUIDELINES_USE_DEFINITION_AS_LABEL = True
 
 MODEL_NAME = "gpt-4o-mini"
+# 實際判讀用的 ollama 模型；think 會改變輸出，因此也納入快取鍵
+OLLAMA_MODEL = "gpt-oss:20b"
+OLLAMA_THINK = True
 MAX_WORKERS = 5
 SKIP_IF_OUTPUT_EXISTS = True
+# 每列判讀完成即追加到 <輸出檔>.journal.jsonl，重跑時略過已成功的列；True 時每行再 fsync（較慢，防斷電）
+JOURNAL_FSYNC = False
+# "async"：所有檔案的列共用一個佇列，由 RPM / TPM token bucket 控制併發；"threads"：逐檔 ThreadPoolExecutor
+ENGINE = "async"
+LLM_RPM = 500
+LLM_TPM = 200_000
+# 本機 ollama 同時能處理的請求有限（OLLAMA_NUM_PARALLEL），預設與舊的 MAX_WORKERS 相同；改接雲端 API 時再調高
+LLM_CONCURRENCY = MAX_WORKERS
+# 判讀結果快取：相同模型與完整 prompt 不重送；LLM_CACHE_BYPASS=True 時強制重判並覆寫快取
+USE_LLM_CACHE = True
+LLM_CACHE_BYPASS = False
+LLM_CACHE_PATH = "llm_response_cache.sqlite"
+LLM_CACHE_TTL_DAYS = 90
 
 COL_CHUNK = "Chunk Text"
+COL_CHUNK_ID = "Chunk ID"
 COL_LABEL = "Label"
 COL_DEF = "Definition"
 COL_POINT = "Point"
@@ -114,15 +139,11 @@ def build_chain(api_key: str):
     return prompt_template | llm | parser
 
 
-def _return_default(retry_state):
-    print(retry_state)
-    return {"result": [{"reasoning": "", "is_disclosed": "", "confidence": 0.0}]}
-
-
+# 重試耗盡時拋出最後一次的例外，由 to_result(error=...) 記為 API error，續跑時會重新判讀
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(min=1, max=30),
-    retry_error_callback=_return_default,
+    reraise=True,
 )
 def call_chain(
     chain,
@@ -131,9 +152,14 @@ def call_chain(
     point: str = "",
     pos1: str = "",
     pos2: str = "",
+    cache: Optional[LLMResponseCache] = None,
 ) -> dict:
     prompt = get_prompt(chunk, standard_text_for_label, point)
-    response: ChatResponse = chat(model='gpt-oss:20b',think=True, messages=[
+    if cache is not None:
+        cached = cache.get(prompt)
+        if cached is not None:
+            return cached
+    response: ChatResponse = chat(model=OLLAMA_MODEL, think=OLLAMA_THINK, messages=[
         {
             'role': 'user',
             'content': prompt,
@@ -149,9 +175,45 @@ def call_chain(
     #     response = second_chain.invoke({"input": prompt})
     #     result = response.model_dump()
     #     # print("\nSecond:", result)
+    if cache is not None:
+        # 只快取成功解析的結果
+        used = (response.prompt_eval_count or 0) + (response.eval_count or 0)
+        cache.put(prompt, result.model_dump(), used or None)
     return result.model_dump()
 
 
+async def call_chain_async(client: AsyncClient, prompt: str) -> Tuple[dict, Optional[int]]:
+    """非同步版 call_chain；重試與 429 退避交給 AsyncJudgeEngine，回傳 (結果, 實際 token 數)。"""
+    response: ChatResponse = await client.chat(model=OLLAMA_MODEL, think=OLLAMA_THINK, messages=[
+        {
+            'role': 'user',
+            'content': prompt,
+        },
+    ])
+    parser = PydanticOutputParser(pydantic_object=ResultList)
+    result = parser.parse(response.message.content)
+    used = (response.prompt_eval_count or 0) + (response.eval_count or 0)
+    return result.model_dump(), used or None
+
+
+async def close_client(client: AsyncClient):
+    # 新版 ollama 提供 close()；舊版只能關掉底層的 httpx.AsyncClient
+    close = getattr(client, "close", None)
+    await (close() if close else client._client.aclose())
+
+
+def build_llm_cache() -> Optional[LLMResponseCache]:
+    if not USE_LLM_CACHE:
+        return None
+    return LLMResponseCache(
+        "ollama",
+        f"{OLLAMA_MODEL}+think" if OLLAMA_THINK else OLLAMA_MODEL,
+        path=LLM_CACHE_PATH,
+        ttl_days=LLM_CACHE_TTL_DAYS,
+        bypass=LLM_CACHE_BYPASS,
+    )
+
+
 def second_invocation_chain(api_key: str):
     llm = ChatOpenAI(model="gpt-4.1-mini", api_key=api_key, temperature=0)
     # llm = ChatVertexAI(model_name="gemini-2.5-flash", temperature=0)
@@ -168,13 +230,12 @@ def second_invocation_chain(api_key: str):
 def infer_company_and_output_path(input_path: str) -> Tuple[str, str]:
     base = os.path.basename(input_path)
     company = base.split("_output_chunks")[0]
+    name_no_ext, ext = os.path.splitext(base)
     if "_output_chunks" in base:
-        out_base = base.replace("_output_chunks", OUTPUT_SUFFIX.replace(".csv", ""))
+        out_base = name_no_ext.replace("_output_chunks", OUTPUT_SUFFIX.replace(".csv", ""))
     else:
-        name_no_ext = os.path.splitext(base)[0]
-        out_base = f"{name_no_ext}_with_CoT_v1_few_shot.csv"
-    if not out_base.lower().endswith(".csv"):
-        out_base += ".csv"
+        out_base = f"{name_no_ext}_with_CoT_v1_few_shot"
+    out_base += ".parquet" if ext.lower() == ".parquet" else ".csv"
 
     original_dir = os.path.dirname(input_path)
     output_dir = os.path.join(original_dir, OUTPUT_SUBDIR)
@@ -229,25 +290,102 @@ def ensure_util_columns(df: pd.DataFrame, company: str) -> pd.DataFrame:
     return df
 
 
-def process_one_file(path: str, chain, pe_map: Dict[str, Tuple[str, str]]):
+def load_input(path: str) -> Optional[pd.DataFrame]:
     try:
-        df = pd.read_csv(path, dtype=str).fillna("")
+        if path.endswith(".parquet"):
+            return load_results(path).fillna("")
+        return pd.read_csv(path, dtype=str).fillna("")
     except Exception:
         try:
-            df = pd.read_excel(path, dtype=str).fillna("")
+            return pd.read_excel(path, dtype=str).fillna("")
         except Exception as e:
             print(f"[ERROR] 讀檔失敗：{os.path.basename(path)} → {e}")
-            return
+            return None
+
+
+def journal_path(out_path: str) -> str:
+    return f"{out_path}.journal.jsonl"
+
+
+def row_key(row, idx, company: str) -> Tuple[str, str, str]:
+    """(公司, Label, Chunk ID)；舊檔沒有 Chunk ID 欄位時退回列號。"""
+    chunk_id = str(row.get(COL_CHUNK_ID, "") or "") or f"row{idx}"
+    return (company, str(row.get(COL_LABEL, "") or ""), chunk_id)
+
+
+def load_journal(path: str, include_errors: bool = False) -> dict:
+    """讀回 {row_key: (reasoning, yn, confidence, err)}，同一鍵以最後一筆為準。
+
+    include_errors=False 時略過 API 錯誤的紀錄，續跑會重新判讀這些列。
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 中斷時寫到一半的行
+                continue
+            key = (entry["company"], entry["label"], entry["chunk_id"])
+            if entry.get("error") and not include_errors:
+                done.pop(key, None)
+                continue
+            done[key] = (
+                entry["reasoning"],
+                entry["yn"],
+                entry["confidence"],
+                entry.get("error"),
+            )
+    return done
+
+
+def open_journal(out_path: str):
+    path = journal_path(out_path)
+    f = open(path, "a", encoding="utf-8")
+    if f.tell() > 0:
+        # 上次寫到一半的行補上換行，避免與新紀錄黏在一起
+        with open(path, "rb") as r:
+            r.seek(-1, os.SEEK_END)
+            if r.read(1) != b"\n":
+                f.write("\n")
+    return f
+
+
+def append_journal(f, key: Tuple[str, str, str], result):
+    _, reasoning, yn, confidence, err = result
+    entry = {
+        "company": key[0],
+        "label": key[1],
+        "chunk_id": key[2],
+        "reasoning": reasoning,
+        "yn": yn,
+        "confidence": confidence,
+        "error": err,
+    }
+    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    f.flush()
+    if JOURNAL_FSYNC:
+        os.fsync(f.fileno())
+
+
+def prepare_file(path: str, pe_map: Dict[str, Tuple[str, str]]):
+    """讀檔並整理出待判讀的列（略過 journal 中已成功的列）；已有輸出或讀檔失敗時回傳 None。"""
+    df = load_input(path)
+    if df is None:
+        return None
 
     company, out_path = infer_company_and_output_path(path)
     if SKIP_IF_OUTPUT_EXISTS and os.path.exists(out_path):
         print(f"[SKIP] 已存在輸出：{os.path.basename(out_path)}")
-        return
+        return None
 
     df = attach_positive_examples(df, pe_map)
     df = ensure_util_columns(df, company)
+    done = load_journal(journal_path(out_path))
 
-    tasks = []
+    tasks, keys, queued = [], {}, set()
     for idx, row in df.iterrows():
         chunk = str(row.get(COL_CHUNK, "") or "")
         label_text_for_prompt = (
@@ -262,12 +400,73 @@ def process_one_file(path: str, chain, pe_map: Dict[str, Tuple[str, str]]):
         if not (chunk and label_text_for_prompt):
             continue
 
+        key = row_key(row, idx, company)
+        keys[idx] = key
+        if key in done or key in queued:
+            continue
+        queued.add(key)
         pos1 = str(row.get(COL_PE1, "") or "")
         pos2 = str(row.get(COL_PE2, "") or "")
         tasks.append((idx, chunk, label_text_for_prompt, guideline_point, pos1, pos2))
 
-    results = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+    resumed = sum(key in done for key in keys.values())
+    if resumed:
+        print(f"[INFO] {os.path.basename(path)}：journal 已有 {resumed} 列，續跑其餘 {len(tasks)} 列")
+    return df, company, out_path, tasks, keys
+
+
+def to_result(idx, data=None, error: Optional[Exception] = None):
+    """把 call_chain 的輸出（或例外）轉成 (idx, reasoning, yn, confidence, err)。"""
+    if error is not None:
+        return (idx, "", "N", 0.0, f"API error: {error}")
+    if data and data.get("result"):
+        first = data["result"][0]
+        reasoning = (first.get("reasoning") or "").strip()
+        yn = (first.get("is_disclosed") or "").strip().upper()
+        yn = "Y" if yn == "Y" else "N"
+        confidence = first.get("confidence", 0.0)
+        return (idx, reasoning, yn, confidence, None)
+    return (idx, "", "N", 0.0, "Empty parser result")
+
+
+def finalize_file(path: str, df: pd.DataFrame, company: str, out_path: str, keys: dict):
+    """由 journal 產生最終輸出（先寫暫存檔再 os.replace），成功後刪除 journal。"""
+    done = load_journal(journal_path(out_path), include_errors=True)
+    for idx, key in keys.items():
+        if key not in done:
+            continue
+        reasoning, yn, confidence, err = done[key]
+        df.at[idx, COL_REASON] = reasoning if not err else err
+        df.at[idx, COL_YN] = yn
+        try:
+            df.at[idx, COL_CONFIDENCE] = float(confidence)
+        except Exception:
+            df.at[idx, COL_CONFIDENCE] = 0.0
+
+    if out_path.endswith(".parquet"):
+        # 指引與文本塊仍只存在輸入檔的維度表，輸出只多了判讀欄位
+        write_results(df, out_path, company, dims_dir_of(path))
+    else:
+        tmp_path = f"{out_path}.tmp"
+        df.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+        os.replace(tmp_path, out_path)
+    os.remove(journal_path(out_path))
+    print(f"[SUCCESS] 輸出：{out_path}")
+
+
+def process_one_file(
+    path: str,
+    chain,
+    pe_map: Dict[str, Tuple[str, str]],
+    cache: Optional[LLMResponseCache] = None,
+):
+    prepared = prepare_file(path, pe_map)
+    if prepared is None:
+        return
+    df, company, out_path, tasks, keys = prepared
+
+    journal = open_journal(out_path)
+    with journal, ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
         futures = {
             ex.submit(
                 call_chain,
@@ -277,6 +476,7 @@ def process_one_file(path: str, chain, pe_map: Dict[str, Tuple[str, str]]):
                 guideline_point,
                 pos1,
                 pos2,
+                cache,
             ): idx
             for (
                 idx,
@@ -292,29 +492,72 @@ def process_one_file(path: str, chain, pe_map: Dict[str, Tuple[str, str]]):
         ):
             idx = futures[fut]
             try:
-                data = fut.result()
-                if data and data.get("result"):
-                    first = data["result"][0]
-                    reasoning = (first.get("reasoning") or "").strip()
-                    yn = (first.get("is_disclosed") or "").strip().upper()
-                    yn = "Y" if yn == "Y" else "N"
-                    confidence = first.get("confidence", 0.0)
-                    results.append((idx, reasoning, yn, confidence, None))
-                else:
-                    results.append((idx, "", "N", 0.0, "Empty parser result"))
+                result = to_result(idx, fut.result())
             except Exception as e:
-                results.append((idx, "", "N", 0.0, f"API error: {e}"))
-
-    for idx, reasoning, yn, confidence, err in results:
-        df.at[idx, COL_REASON] = reasoning if not err else err
-        df.at[idx, COL_YN] = yn
+                result = to_result(idx, error=e)
+            append_journal(journal, keys[idx], result)
+
+    finalize_file(path, df, company, out_path, keys)
+
+
+def process_all_async(
+    paths: List[str],
+    pe_map: Dict[str, Tuple[str, str]],
+    cache: Optional[LLMResponseCache] = None,
+):
+    """所有檔案的列串流進同一個佇列；每列完成即寫入該檔的 journal，某檔全部完成就立刻寫出該檔。"""
+    state = {}
+    progress = tqdm(desc="judging", unit="row")
+
+    def sources():
+        # 逐檔延遲讀取，佇列有界，不會一次把所有檔案載入記憶體
+        for path in paths:
+            prepared = prepare_file(path, pe_map)
+            if prepared is None:
+                continue
+            df, company, out_path, tasks, keys = prepared
+            state[path] = (df, company, out_path, keys, open_journal(out_path))
+            progress.total = (progress.total or 0) + len(tasks)
+            progress.refresh()
+            yield path, (
+                Job(path, idx, get_prompt(chunk, label_text, point))
+                for idx, chunk, label_text, point, _, _ in tasks
+            )
+
+    def on_result(job: Job, result):
+        error = result if isinstance(result, Exception) else None
+        _, _, _, keys, journal = state[job.source]
+        result = to_result(job.key, None if error else result, error)
+        append_journal(journal, keys[job.key], result)
+        progress.update(1)
+
+    def on_source_done(path: str):
+        df, company, out_path, keys, journal = state.pop(path)
+        journal.close()
+        finalize_file(path, df, company, out_path, keys)
+
+    async def judge_all() -> AsyncJudgeEngine:
+        # 整個執行共用一個 AsyncClient（連線池），結束時關閉
+        client = AsyncClient()
+
+        async def call(prompt: str):
+            return await call_chain_async(client, prompt)
+
+        engine = AsyncJudgeEngine(
+            call,
+            RateLimiter(LLM_RPM, LLM_TPM),
+            concurrency=LLM_CONCURRENCY,
+            cache=cache,
+        )
         try:
-            df.at[idx, COL_CONFIDENCE] = float(confidence)
-        except Exception:
-            df.at[idx, COL_CONFIDENCE] = 0.0
+            await engine.run(sources(), on_result, on_source_done)
+        finally:
+            await close_client(client)
+        return engine
 
-    df.to_csv(out_path, index=False, encoding="utf-8-sig")
-    print(f"[SUCCESS] 輸出：{out_path}")
+    engine = asyncio.run(judge_all())
+    progress.close()
+    engine.log_summary()
 
 
 def main():
@@ -335,8 +578,14 @@ def main():
         return
 
     print(f"[INFO] 共找到 {len(paths)} 個輸入檔")
-    for p in paths:
-        process_one_file(p, chain, pe_map)
+    cache = build_llm_cache()
+    if ENGINE == "async":
+        process_all_async(paths, pe_map, cache)
+    else:
+        for p in paths:
+            process_one_file(p, chain, pe_map, cache)
+    if cache is not None:
+        cache.log_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+# ===== 可調參數 =====
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+DEFAULT_CONCURRENCY = 5
+# 中文約 1 字 1 token，英數較少；估計值只用於事前扣額度，拿到實際用量後會再校正
+CHARS_PER_TOKEN = 1.0
+EXPECTED_OUTPUT_TOKENS = 600
+MAX_ATTEMPTS = 3
+MAX_RATE_LIMIT_RETRIES = 10
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+# 每隔幾秒印一次最近區間的吞吐與額度使用率；None 表示不印
+REPORT_INTERVAL = 60.0
+
+
+def estimate_tokens(prompt: str) -> int:
+    return int(len(prompt) / CHARS_PER_TOKEN) + EXPECTED_OUTPUT_TOKENS
+
+
+def rate_limit_delay(exc: Exception) -> Optional[float]:
+    """若為 HTTP 429 回傳建議等待秒數（沒有 Retry-After 時回傳 0），否則回傳 None。
+
+    只看狀態碼（ollama ResponseError、openai APIStatusError 的 status_code，或 httpx 的 response），
+    不比對例外訊息，避免內容含有 429 的解析錯誤讓所有 worker 一起暫停。
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """每分鐘補充 per_minute 單位，最多存 burst 單位；餘額可為負（事後校正的超用）。"""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.used = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # 單次需求超過容量時，只要求桶滿即可放行，避免永遠等不到
+        need = min(amount, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+        self.used += amount
+
+
+class RateLimiter:
+    """RPM 與 TPM 兩個 token bucket；遇到 429 時所有 worker 一起暫停。"""
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.pause_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        async with self._lock:
+            while True:
+                wait = max(
+                    self.pause_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def correct(self, estimated: int, actual: int):
+        self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float):
+        self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+
+
+class Job:
+    __slots__ = ("source", "key", "prompt")
+
+    def __init__(self, source: str, key: Any, prompt: str):
+        self.source = source
+        self.key = key
+        self.prompt = prompt
+
+
+class AsyncJudgeEngine:
+    """把所有檔案的列串進同一個佇列，以固定數量的 worker 消化，跨檔案不會有空檔。
+
+    call(prompt) 需回傳 (結果, 實際 token 數或 None)；on_result(job, 結果或例外) 在每列完成時呼叫，
+    on_source_done(source) 在某個來源的所有列都完成時呼叫。
+    cache（選填，需有 get(prompt) / put(prompt, 結果, tokens)）在扣額度前查詢，命中的列不佔 RPM / TPM。
+    """
+
+    def __init__(
+        self,
+        call: Callable[[str], Awaitable[Tuple[Any, Optional[int]]]],
+        limiter: RateLimiter,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_attempts: int = MAX_ATTEMPTS,
+        cache=None,
+    ):
+        self.call = call
+        self.cache = cache
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.stats = {"rows": 0, "failed": 0, "rate_limited": 0, "retries": 0, "cached": 0}
+        self._remaining: Dict[str, int] = {}
+        self._producing: Dict[str, bool] = {}
+
+    async def _run_one(self, job: Job):
+        if self.cache is not None:
+            cached = self.cache.get(job.prompt)
+            if cached is not None:
+                self.stats["cached"] += 1
+                return cached
+        estimated = estimate_tokens(job.prompt)
+        attempt = limited = 0
+        while True:
+            await self.limiter.acquire(estimated)
+            try:
+                result, actual = await self.call(job.prompt)
+                if actual:
+                    self.limiter.correct(estimated, actual)
+                if self.cache is not None:
+                    self.cache.put(job.prompt, result, actual)
+                return result
+            except Exception as e:
+                delay = rate_limit_delay(e)
+                if delay is not None and limited < MAX_RATE_LIMIT_RETRIES:
+                    # 429 另計次數；全體暫停，等待時間取 Retry-After 與指數退避的較大者
+                    limited += 1
+                    self.stats["rate_limited"] += 1
+                    backoff = min(BACKOFF_MAX, BACKOFF_BASE**limited)
+                    self.limiter.pause(max(delay, backoff) + random.uniform(0, 1))
+                    continue
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    return e
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_BASE**attempt))
+
+    async def _worker(self, queue: asyncio.Queue, on_result, on_source_done):
+        while True:
+            job = await queue.get()
+            if job is None:
+                queue.task_done()
+                return
+            result = await self._run_one(job)
+            self.stats["rows"] += 1
+            if isinstance(result, Exception):
+                self.stats["failed"] += 1
+            on_result(job, result)
+            self._remaining[job.source] -= 1
+            if self._remaining[job.source] == 0 and not self._producing[job.source]:
+                on_source_done(job.source)
+            queue.task_done()
+
+    async def _reporter(self):
+        last_rows, last_req, last_tok = 0, 0.0, 0.0
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            rows, req, tok = (
+                self.stats["rows"],
+                self.limiter.requests.used,
+                self.limiter.tokens.used,
+            )
+            minutes = REPORT_INTERVAL / 60.0
+            print(
+                f"[INFO] 最近 {REPORT_INTERVAL:.0f}s：{(rows - last_rows) / REPORT_INTERVAL:.2f} rows/s，"
+                f"RPM {(req - last_req) / minutes / self.limiter.rpm:.0%}、"
+                f"TPM {(tok - last_tok) / minutes / self.limiter.tpm:.0%}，累計 {rows} 列"
+            )
+            last_rows, last_req, last_tok = rows, req, tok
+
+    async def run(
+        self,
+        sources: Iterable[Tuple[str, Iterable[Job]]],
+        on_result: Callable[[Job, Any], None],
+        on_source_done: Callable[[str], None],
+    ):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        self.started = time.monotonic()
+        workers = [
+            asyncio.create_task(self._worker(queue, on_result, on_source_done))
+            for _ in range(self.concurrency)
+        ]
+        reporter = asyncio.create_task(self._reporter()) if REPORT_INTERVAL else None
+        for source, jobs in sources:
+            self._remaining[source] = 0
+            self._producing[source] = True
+            for job in jobs:
+                self._remaining[source] += 1
+                await queue.put(job)
+            self._producing[source] = False
+            if self._remaining[source] == 0:
+                on_source_done(source)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        if reporter is not None:
+            reporter.cancel()
+        self.elapsed = time.monotonic() - self.started
+
+    def summary(self) -> Dict[str, float]:
+        minutes = max(self.elapsed, 1e-9) / 60.0
+        req_used = self.limiter.requests.used
+        tok_used = self.limiter.tokens.used
+        return {
+            **self.stats,
+            "elapsed_s": self.elapsed,
+            "rows_per_s": self.stats["rows"] / max(self.elapsed, 1e-9),
+            "rpm_used": req_used / minutes,
+            "tpm_used": tok_used / minutes,
+            "rpm_utilization": req_used / minutes / self.limiter.rpm,
+            "tpm_utilization": tok_used / minutes / self.limiter.tpm,
+        }
+
+    def log_summary(self):
+        s = self.summary()
+        print(
+            f"[INFO] 判讀完成 {s['rows']} 列（快取 {s['cached']}、失敗 {s['failed']}、"
+            f"重試 {s['retries']}、429 {s['rate_limited']} 次），耗時 {s['elapsed_s']:.1f}s，"
+            f"平均 {s['rows_per_s']:.2f} rows/s"
+        )
+        print(
+            f"[INFO] 額度使用率：RPM {s['rpm_used']:.0f}/{self.limiter.rpm}"
+            f"（{s['rpm_utilization']:.1%}），TPM {s['tpm_used']:.0f}/{self.limiter.tpm}"
+            f"（{s['tpm_utilization']:.1%}）"
+        )
+
+
+def run_engine(engine: AsyncJudgeEngine, sources, on_result, on_source_done):
+    asyncio.run(engine.run(sources, on_result, on_source_done))
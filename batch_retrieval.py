@@ -0,0 +1,283 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from matrix_index import MatrixIndex, compact_scores, normalize_rows, top_k
+from lexical_index import reciprocal_rank_fusion
+
+
+class CandidateBatch:
+    """一次檢索所有指引的結果。
+
+    ids / distances 形狀皆為 (n_guidelines, K)；候選不足 K 個時 ids 以 -1 補齊。
+    distances 與 similarity_search_with_score 相同，為 cosine 距離（越小越相似）。
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        distances: np.ndarray,
+        get_document: Callable[[int], Document],
+    ):
+        self.ids = ids
+        self.distances = distances
+        self._get_document = get_document
+        self._docs: Dict[int, Document] = {}
+        # 分層檢索時記錄各層耗時（秒）
+        self.timing: Dict[str, float] = {}
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def document(self, i: int) -> Document:
+        if i not in self._docs:
+            self._docs[i] = self._get_document(i)
+        return self._docs[i]
+
+    def candidates(self, row: int) -> List[Tuple[Document, float]]:
+        return [
+            (self.document(int(i)), float(d))
+            for i, d in zip(self.ids[row], self.distances[row])
+            if i >= 0
+        ]
+
+
+def _search_matrix(db: MatrixIndex, queries: np.ndarray, k: int) -> CandidateBatch:
+    ids, sims = db.search_by_vectors(queries, k)
+    return CandidateBatch(ids, (1.0 - sims).astype(np.float32), db.get_document)
+
+
+def _search_chroma(db, queries: np.ndarray, k: int) -> CandidateBatch:
+    n = queries.shape[0]
+    k = min(k, db._collection.count())
+    if k == 0:
+        empty = np.zeros((n, 0))
+        return CandidateBatch(empty.astype(np.int64), empty.astype(np.float32), None)
+
+    # Chroma 的 query 一次可接多個查詢向量，只需一次往返
+    res = db._collection.query(
+        query_embeddings=queries.tolist(),
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+    local: Dict[str, int] = {}
+    docs: List[Document] = []
+    ids = np.full((n, k), -1, dtype=np.int64)
+    distances = np.full((n, k), np.inf, dtype=np.float32)
+    for row in range(n):
+        for col, cid in enumerate(res["ids"][row]):
+            if cid not in local:
+                local[cid] = len(docs)
+                docs.append(
+                    Document(
+                        page_content=res["documents"][row][col],
+                        metadata=res["metadatas"][row][col] or {},
+                    )
+                )
+            ids[row, col] = local[cid]
+            distances[row, col] = res["distances"][row][col]
+    return CandidateBatch(ids, distances, docs.__getitem__)
+
+
+def search_batch(db, queries: np.ndarray, k: int) -> CandidateBatch:
+    """以整個指引矩陣一次檢索每條指引的前 k 個候選。"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if isinstance(db, MatrixIndex):
+        return _search_matrix(db, queries, k)
+    return _search_chroma(db, queries, k)
+
+
+def _fetch_by_chunk_ids(db, chunk_ids: List[str]) -> Dict[str, Tuple[Document, np.ndarray]]:
+    """依 chunk_id 取回文本塊與向量，供只出現在 BM25 結果裡的候選計算 cosine 距離。"""
+    if not chunk_ids:
+        return {}
+    out = {}
+    if isinstance(db, MatrixIndex):
+        rows_by_id = {str(int(c)): i for i, c in enumerate(db.meta["chunk_id"])}
+        rows = np.array([rows_by_id[c] for c in chunk_ids if c in rows_by_id], dtype=np.int64)
+        if not len(rows):
+            return {}
+        vectors = db.full_precision_rows(rows)
+        for j, row in enumerate(rows):
+            doc = db.get_document(int(row))
+            out[doc.metadata["chunk_id"]] = (
+                doc,
+                vectors[j] if vectors is not None else None,
+            )
+        return out
+
+    res = db._collection.get(
+        where={"chunk_id": {"$in": list(chunk_ids)}},
+        include=["documents", "metadatas", "embeddings"],
+    )
+    for text, meta, vec in zip(res["documents"], res["metadatas"], res["embeddings"]):
+        meta = meta or {}
+        out[str(meta.get("chunk_id"))] = (
+            Document(page_content=text, metadata=meta),
+            np.asarray(vec, dtype=np.float32),
+        )
+    return out
+
+
+def hybrid_search_batch(
+    db,
+    lexical,
+    queries: np.ndarray,
+    query_texts: List[str],
+    k: int,
+    dense_k: int,
+    lexical_k: int,
+    rrf_k: int = 60,
+) -> CandidateBatch:
+    """向量前 dense_k 與 BM25 前 lexical_k 以 RRF 融合，每條指引只留 k 個候選。
+
+    distances 仍為與指引向量的 cosine 距離，只出現在 BM25 結果的候選會補算。
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    dense = search_batch(db, queries, dense_k)
+    lex_ids, _ = lexical.search(query_texts, lexical_k)
+
+    n = queries.shape[0]
+    fused_rows: List[List[str]] = []
+    known: Dict[str, Tuple[Document, float]] = {}
+    known_rows: List[Dict[str, float]] = []
+    for row in range(n):
+        dense_row = {}
+        ranking = []
+        for doc, dist in dense.candidates(row):
+            cid = str(doc.metadata.get("chunk_id"))
+            known[cid] = (doc, dist)
+            dense_row[cid] = dist
+            ranking.append(cid)
+        known_rows.append(dense_row)
+        fused_rows.append(reciprocal_rank_fusion([ranking, lex_ids[row]], k, rrf_k))
+
+    # 不在該條指引向量候選裡的文本塊都要補算距離
+    missing = {
+        c for row, fused in enumerate(fused_rows) for c in fused if c not in known_rows[row]
+    }
+    fetched = _fetch_by_chunk_ids(db, sorted(missing))
+    q_norm = normalize_rows(queries)
+
+    local: Dict[str, int] = {}
+    docs: List[Document] = []
+    width = max((len(r) for r in fused_rows), default=0)
+    ids = np.full((n, width), -1, dtype=np.int64)
+    distances = np.full((n, width), np.inf, dtype=np.float32)
+    for row, fused in enumerate(fused_rows):
+        col = 0
+        for cid in fused:
+            if cid in known_rows[row]:
+                doc, dist = known[cid][0], known_rows[row][cid]
+            elif cid in fetched:
+                doc, vec = fetched[cid]
+                if vec is None:
+                    dist = np.nan
+                else:
+                    dist = 1.0 - float(q_norm[row] @ normalize_rows(vec[None, :])[0])
+            else:
+                continue
+            if cid not in local:
+                local[cid] = len(docs)
+                docs.append(doc)
+            ids[row, col] = local[cid]
+            distances[row, col] = dist
+            col += 1
+    return CandidateBatch(ids, distances, docs.__getitem__)
+
+
+def _search_matrix_in_pages(
+    db: MatrixIndex,
+    queries: np.ndarray,
+    pages: List[List[int]],
+    merged: List[List[str]],
+    k: int,
+) -> CandidateBatch:
+    q = normalize_rows(queries)
+    page_of_row = np.asarray(db.meta["page"])
+    chunk_of_row = np.asarray(db.meta["chunk_id"])
+    ids = np.full((len(q), k), -1, dtype=np.int64)
+    distances = np.full((len(q), k), np.inf, dtype=np.float32)
+    for row, (wanted, extra) in enumerate(zip(pages, merged)):
+        mask = np.isin(page_of_row, wanted)
+        if extra:
+            mask |= np.isin(chunk_of_row, [int(c) for c in extra])
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            continue
+        if db.vectors is not None:
+            sims = q[row : row + 1] @ np.asarray(db.vectors[rows]).T
+        else:
+            scales = db.compact_scales
+            scales = None if scales is None else np.asarray(scales[rows])
+            codes = np.asarray(db.compact[rows])
+            sims = compact_scores(q[row : row + 1], codes, scales)
+        local, best = top_k(sims, k)
+        n = local.shape[1]
+        ids[row, :n] = rows[local[0]]
+        distances[row, :n] = 1.0 - best[0]
+    return CandidateBatch(ids, distances, db.get_document)
+
+
+def _search_chroma_in_pages(
+    db,
+    queries: np.ndarray,
+    pages: List[List[int]],
+    merged: List[List[str]],
+    limits: List[int],
+    k: int,
+) -> CandidateBatch:
+    local: Dict[str, int] = {}
+    docs: List[Document] = []
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    for row, (wanted, extra, limit) in enumerate(zip(pages, merged, limits)):
+        if not wanted or not limit:
+            continue
+        where = {"page": {"$in": [int(p) for p in wanted]}}
+        if extra:
+            where = {"$or": [where, {"chunk_id": {"$in": list(extra)}}]}
+        # 每條指引的頁面不同，只能逐條查詢；n_results 不可超過篩選後的文本塊數
+        res = db._collection.query(
+            query_embeddings=[queries[row].tolist()],
+            n_results=min(k, limit),
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        for col, cid in enumerate(res["ids"][0][:k]):
+            if cid not in local:
+                local[cid] = len(docs)
+                docs.append(
+                    Document(
+                        page_content=res["documents"][0][col],
+                        metadata=res["metadatas"][0][col] or {},
+                    )
+                )
+            ids[row, col] = local[cid]
+            distances[row, col] = res["distances"][0][col]
+    return CandidateBatch(ids, distances, docs.__getitem__)
+
+
+def hierarchical_search_batch(
+    db, page_index, queries: np.ndarray, k: int, top_pages: int
+) -> CandidateBatch:
+    """先以頁面向量選出每條指引的前 top_pages 頁，再只在這些頁的文本塊裡取前 k 個。
+
+    去重合併過的文本塊只要出現過的任一頁被選中就納入（依 dedup_pages.json）。
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    t0 = time.perf_counter()
+    pages = page_index.search(queries, top_pages)
+    page_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    merged = [page_index.merged_chunks(p) for p in pages]
+    if isinstance(db, MatrixIndex):
+        batch = _search_matrix_in_pages(db, queries, pages, merged, k)
+    else:
+        limits = [page_index.chunk_count(p) + len(m) for p, m in zip(pages, merged)]
+        batch = _search_chroma_in_pages(db, queries, pages, merged, limits, k)
+    batch.timing = {"page_s": page_sec, "chunk_s": time.perf_counter() - t0}
+    return batch
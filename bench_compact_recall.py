@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import pandas as pd
+import torch
+
+from embedding_backends import build_embeddings
+from matrix_index import (
+    MatrixIndex,
+    compact_scores,
+    compact_vectors,
+    normalize_rows,
+    top_k,
+)
+from query_all_report import get_chroma_dirs, load_guidelines
+
+# ===== 可調參數 =====
+# 需要以 INDEX_BACKEND="matrix" 且保留 float32 建好的索引
+# 磁碟用量以一般 float32 索引的向量檔為 1：
+#   disk_ratio_keep_f32     COMPACT_KEEP_FLOAT32=True（預設）：精簡向量另外存，加上原本的 float32，一定 > 1
+#   disk_ratio_compact_only COMPACT_KEEP_FLOAT32=False：只存精簡向量，才真的省空間；
+#                           代價是查詢時重新計分要重新 embed 候選（這裡的 recall_rescored 以存好的 float32 代替）
+BASE_MATRIX_PATH = "matrix_report_TCFD"
+GUIDELINES_PATH = "data/tcfd第四層揭露指引.xlsx"
+EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+OUTPUT_CSV = "data/bench/compact_recall.csv"
+CANDIDATE_K = 50
+RESCORE_MULTIPLIERS = [1, 2, 4]
+# (截斷維度, 是否 int8)；None 表示不截斷
+SETTINGS = [
+    (None, True),
+    (512, False),
+    (512, True),
+    (256, False),
+    (256, True),
+    (128, True),
+]
+
+
+def recall(ids: np.ndarray, truth: np.ndarray) -> float:
+    hits = [len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(ids, truth)]
+    return float(np.mean(hits))
+
+
+def main():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    embeddings = build_embeddings(EMBEDDING_MODEL_NAME, device=device)
+    guidelines = load_guidelines(GUIDELINES_PATH)
+    queries = normalize_rows(
+        embeddings.embed_documents([g["Definition"] for g in guidelines])
+    )
+
+    rows = []
+    for path in get_chroma_dirs(BASE_MATRIX_PATH):
+        index = MatrixIndex(path)
+        if index.vectors is None or len(index) == 0:
+            continue
+        full = np.asarray(index.vectors)
+        truth, _ = top_k(queries @ full.T, CANDIDATE_K)
+
+        for dim, int8 in SETTINGS:
+            codes, scales = compact_vectors(full, dim, int8)
+            coarse = compact_scores(queries, codes, scales)
+            bytes_per_vec = codes.shape[1] * codes.itemsize + (4 if int8 else 0)
+            f32_bytes = full.shape[1] * 4
+            for mult in RESCORE_MULTIPLIERS:
+                ids, _ = top_k(coarse, CANDIDATE_K * mult)
+                rescored = np.take_along_axis(queries @ full.T, ids, axis=1)
+                order, _ = top_k(rescored, CANDIDATE_K)
+                final = np.take_along_axis(ids, order, axis=1)
+                rows.append(
+                    {
+                        "Company": os.path.basename(path),
+                        "dim": dim or full.shape[1],
+                        "int8": int8,
+                        "rescore_multiplier": mult,
+                        "compact_bytes_per_vector": bytes_per_vec,
+                        "disk_ratio_keep_f32": (bytes_per_vec + f32_bytes) / f32_bytes,
+                        "disk_ratio_compact_only": bytes_per_vec / f32_bytes,
+                        "recall_coarse": recall(ids[:, :CANDIDATE_K], truth),
+                        "recall_rescored": recall(final, truth),
+                    }
+                )
+
+    if not rows:
+        print(f"[ERROR] 在 {BASE_MATRIX_PATH} 找不到含 float32 向量的 matrix 索引。")
+        return
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    summary = (
+        df.groupby(["dim", "int8", "rescore_multiplier"])[
+            [
+                "disk_ratio_keep_f32",
+                "disk_ratio_compact_only",
+                "recall_coarse",
+                "recall_rescored",
+            ]
+        ]
+        .mean()
+        .round(4)
+    )
+    print(f"Recall@{CANDIDATE_K} vs float32 exact top-{CANDIDATE_K}:")
+    print(summary.to_string())
+    print(
+        "[INFO] 只有 COMPACT_KEEP_FLOAT32=False 會減少磁碟用量（disk_ratio_compact_only），"
+        "此時重新計分需在查詢時重新 embed 候選；保留 float32 時索引反而變大。"
+    )
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import time
+import pandas as pd
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from bench_onnx_embeddings import sample_texts
+from embedding_backends import build_embeddings
+from embedding_batching import ENCODE_BATCH_SIZE, encode_padded_tokens, plan_batches
+
+# ===== 可調參數 =====
+# 對照組為實際的 HuggingFaceEmbeddings.embed_documents（encode 內已依長度排序、每 ENCODE_BATCH_SIZE 筆一批），
+# 與 token 預算分桶組批比較同一批文本塊的吞吐量
+EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+DEVICE = "cpu"
+NUM_SAMPLES = 512
+TOKEN_BUDGETS = [4096, 8192, 16384, 32768]
+WARMUP_SAMPLES = 16
+REPEATS = 3
+OUTPUT_CSV = "data/bench/embedding_batching.csv"
+
+
+def best_time(embeddings, texts) -> float:
+    # 兩組都先以同樣的少量文本暖機，再取 REPEATS 次中最快的一次
+    embeddings.embed_documents(texts[:WARMUP_SAMPLES])
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        embeddings.embed_documents(texts)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    texts = sample_texts(NUM_SAMPLES)
+    if not texts:
+        print("[ERROR] 找不到可用的文本塊。")
+        return
+    print(f"[INFO] 取樣 {len(texts)} 個文本塊")
+
+    baseline = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME, model_kwargs={"device": DEVICE}
+    )
+    base_sec = best_time(baseline, texts)
+    rows = [
+        {
+            "batching": f"encode(batch_size={ENCODE_BATCH_SIZE})",
+            "token_budget": None,
+            "chunks_per_sec": len(texts) / base_sec,
+            "speedup": 1.0,
+        }
+    ]
+    lengths = None
+    for budget in TOKEN_BUDGETS:
+        embeddings = build_embeddings(
+            EMBEDDING_MODEL_NAME, device=DEVICE, use_cache=False, token_budget=budget
+        )
+        if lengths is None:
+            lengths = embeddings.token_lengths(texts)
+            rows[0]["padding_efficiency"] = sum(lengths) / encode_padded_tokens(
+                texts, lengths, ENCODE_BATCH_SIZE
+            )
+        sec = best_time(embeddings, texts)
+        padded = sum(
+            len(b) * max(lengths[i] for i in b) for b in plan_batches(lengths, budget)
+        )
+        rows.append(
+            {
+                "batching": "token_budget",
+                "token_budget": budget,
+                "chunks_per_sec": len(texts) / sec,
+                "speedup": base_sec / sec,
+                "padding_efficiency": sum(lengths) / padded,
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    print(df.round(4).to_string(index=False))
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
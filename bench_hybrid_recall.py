@@ -0,0 +1,109 @@
+import os
+import pandas as pd
+import torch
+
+from batch_retrieval import search_batch, hybrid_search_batch
+from bench_retrieval import ANSWER_DIR, load_ground_truth
+from lexical_index import load_lexical_index
+from embedding_backends import build_embeddings
+from query_all_report import (
+    BASE_CHROMA_PATH,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    GUIDELINES_PATH,
+    HYBRID_DENSE_K,
+    HYBRID_LEXICAL_K,
+    RRF_K,
+    embed_guidelines,
+    get_chroma_dirs,
+    load_guidelines,
+    open_report_store,
+)
+
+# ===== 可調參數 =====
+# 以人工標註為 Y 的文本塊（bench_retrieval 的 ANSWER_DIR）當正解，
+# 比較在同樣 recall 下純向量與混合檢索各需要多大的候選數 K
+# 註：標註只涵蓋當時交給標註者看的文本塊，其他真正相關但沒被標到的文本塊不會計入
+K_VALUES = [5, 10, 15, 20, 25, 30, 40, 50]
+TARGET_RECALL = 0.98
+OUTPUT_CSV = "data/bench/hybrid_recall.csv"
+
+
+def candidate_ids(batch, row: int):
+    return {str(doc.metadata.get("chunk_id")) for doc, _ in batch.candidates(row)}
+
+
+def recall(batch, guidelines, reference) -> float:
+    hits = total = 0
+    for gi, item in enumerate(guidelines):
+        truth = reference.get(item["Label"])
+        if not truth:
+            continue
+        hits += len(candidate_ids(batch, gi) & truth)
+        total += len(truth)
+    return hits / total if total else float("nan")
+
+
+def min_k(summary: pd.Series) -> str:
+    ok = summary[summary >= TARGET_RECALL]
+    return str(int(ok.index.min())) if len(ok) else f">{max(K_VALUES)}"
+
+
+def main():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    embeddings = build_embeddings(EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, device=device)
+    guidelines = load_guidelines(GUIDELINES_PATH)
+    guideline_vectors = embed_guidelines(embeddings, guidelines)
+    query_texts = [str(g["Definition"]) for g in guidelines]
+
+    truth = load_ground_truth(ANSWER_DIR)
+    rows = []
+    for store_dir in get_chroma_dirs(BASE_CHROMA_PATH):
+        company_name = os.path.basename(store_dir)
+        reference = truth.get(company_name)
+        lexical = load_lexical_index(store_dir)
+        if reference is None or lexical is None:
+            continue
+        db = open_report_store(store_dir, embeddings)
+        for k in K_VALUES:
+            dense = search_batch(db, guideline_vectors, k)
+            hybrid = hybrid_search_batch(
+                db,
+                lexical,
+                guideline_vectors,
+                query_texts,
+                k=k,
+                dense_k=max(k, HYBRID_DENSE_K),
+                lexical_k=max(k, HYBRID_LEXICAL_K),
+                rrf_k=RRF_K,
+            )
+            rows.append(
+                {
+                    "Company": company_name,
+                    "K": k,
+                    "recall_dense": recall(dense, guidelines, reference),
+                    "recall_hybrid": recall(hybrid, guidelines, reference),
+                }
+            )
+
+    if not rows:
+        print(
+            f"[ERROR] 找不到同時具備 BM25 索引與 {ANSWER_DIR} 人工標註的報告書。"
+        )
+        return
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    summary = df.groupby("K")[["recall_dense", "recall_hybrid"]].mean()
+    print(f"Recall of labelled Y chunks vs candidate budget K（{df['Company'].nunique()} 家公司）：")
+    print(summary.round(4).to_string())
+    print(
+        f"[INFO] 達到 recall ≥ {TARGET_RECALL:.0%} 所需的 K："
+        f"純向量 {min_k(summary['recall_dense'])}、混合 {min_k(summary['recall_hybrid'])}"
+    )
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from langchain_community.vectorstores import Chroma
+
+from matrix_index import MatrixIndex
+
+# ===== 可調參數 =====
+# 兩個目錄需由 create_all_db.py 以 INDEX_BACKEND="chroma" / "matrix" 各建一次
+BASE_CHROMA_PATH = "chroma_report_TCFD"
+BASE_MATRIX_PATH = "matrix_report_TCFD"
+OUTPUT_CSV = "data/bench/index_backends.csv"
+CANDIDATE_K = 50
+NUM_QUERIES = 40
+SEED = 0
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for r, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(r, f))
+    return total
+
+
+def bench_report(name: str, rng: np.random.Generator) -> dict:
+    matrix_dir = os.path.join(BASE_MATRIX_PATH, name)
+    chroma_dir = os.path.join(BASE_CHROMA_PATH, name)
+
+    t0 = time.perf_counter()
+    mat = MatrixIndex(matrix_dir)
+    matrix_open = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    db = Chroma(persist_directory=chroma_dir)
+    # Chroma 實際載入 HNSW 索引是在第一次存取 collection 時
+    db._collection.count()
+    chroma_open = time.perf_counter() - t0
+
+    # 以報告書自己的文本塊向量加上雜訊當查詢，不需要載入 embedding 模型
+    picks = rng.choice(len(mat), size=min(NUM_QUERIES, len(mat)), replace=False)
+    queries = np.asarray(mat.vectors[picks]) + rng.normal(
+        0, 0.05, size=(len(picks), mat.dim)
+    ).astype(np.float32)
+
+    matrix_lat, chroma_lat, overlaps = [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        exact = mat.similarity_search_by_vector_with_relevance_scores(q, k=CANDIDATE_K)
+        matrix_lat.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        approx = db.similarity_search_by_vector_with_relevance_scores(
+            q.tolist(), k=CANDIDATE_K
+        )
+        chroma_lat.append(time.perf_counter() - t0)
+
+        exact_ids = {d.metadata["chunk_id"] for d, _ in exact}
+        approx_ids = {d.metadata.get("chunk_id") for d, _ in approx}
+        overlaps.append(len(exact_ids & approx_ids) / max(len(exact_ids), 1))
+
+    t0 = time.perf_counter()
+    mat.search_by_vectors(queries, CANDIDATE_K)
+    matrix_batch = time.perf_counter() - t0
+
+    return {
+        "Company": name,
+        "Chunks": len(mat),
+        "matrix_open_ms": matrix_open * 1000,
+        "chroma_open_ms": chroma_open * 1000,
+        "matrix_query_p50_ms": np.percentile(matrix_lat, 50) * 1000,
+        "matrix_query_p95_ms": np.percentile(matrix_lat, 95) * 1000,
+        "matrix_batch_per_query_ms": matrix_batch / len(queries) * 1000,
+        "chroma_query_p50_ms": np.percentile(chroma_lat, 50) * 1000,
+        "chroma_query_p95_ms": np.percentile(chroma_lat, 95) * 1000,
+        "chroma_recall_vs_exact": float(np.mean(overlaps)),
+        "matrix_disk_mb": dir_size(matrix_dir) / 2**20,
+        "chroma_disk_mb": dir_size(chroma_dir) / 2**20,
+    }
+
+
+def main():
+    if not (os.path.isdir(BASE_MATRIX_PATH) and os.path.isdir(BASE_CHROMA_PATH)):
+        print(f"[ERROR] 需要同時存在 {BASE_MATRIX_PATH} 與 {BASE_CHROMA_PATH}")
+        return
+    names = sorted(
+        set(os.listdir(BASE_MATRIX_PATH)) & set(os.listdir(BASE_CHROMA_PATH))
+    )
+    names = [n for n in names if os.path.isdir(os.path.join(BASE_MATRIX_PATH, n))]
+    if not names:
+        print("[ERROR] 兩種索引沒有共同的報告書可比較。")
+        return
+
+    rng = np.random.default_rng(SEED)
+    rows = []
+    for name in names:
+        try:
+            rows.append(bench_report(name, rng))
+        except Exception as e:
+            print(f"[WARN] {name} 量測失敗：{e}")
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    print(df.drop(columns=["Company"]).describe().loc[["mean", "50%", "max"]].T)
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
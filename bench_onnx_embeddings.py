@@ -0,0 +1,95 @@
+import os
+import time
+import pandas as pd
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.vectorstores import Chroma
+
+from matrix_index import MatrixIndex, is_matrix_index, normalize_rows
+from onnx_embeddings import OnnxEmbeddings
+from query_all_report import get_chroma_dirs
+
+# ===== 可調參數 =====
+BASE_STORE_PATH = "chroma_report_TCFD"
+EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+OUTPUT_CSV = "data/bench/onnx_embeddings.csv"
+NUM_SAMPLES = 256
+ONNX_THREADS = [None, 4, 8]
+# 每個 backend 計時前都先以同樣的 WARMUP_SAMPLES 筆暖機
+WARMUP_SAMPLES = 4
+# 每個文本塊與 PyTorch 向量的 cosine 需 ≥ 門檻
+PARITY_THRESHOLD = {"onnx": 0.999, "onnx-int8": 0.98}
+
+
+def sample_texts(n: int):
+    texts = []
+    for path in get_chroma_dirs(BASE_STORE_PATH):
+        if is_matrix_index(path):
+            index = MatrixIndex(path)
+            texts.extend(index.get_text(i) for i in range(min(len(index), n)))
+        else:
+            texts.extend(Chroma(persist_directory=path).get(limit=n)["documents"])
+        if len(texts) >= n:
+            break
+    return texts[:n]
+
+
+def timed_embed(embeddings, texts):
+    t0 = time.perf_counter()
+    vectors = normalize_rows(embeddings.embed_documents(texts))
+    return vectors, time.perf_counter() - t0
+
+
+def main():
+    texts = sample_texts(NUM_SAMPLES)
+    if not texts:
+        print(f"[ERROR] 在 {BASE_STORE_PATH} 找不到可用的文本塊。")
+        return
+    print(f"[INFO] 取樣 {len(texts)} 個文本塊")
+
+    torch_embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME, model_kwargs={"device": "cpu"}
+    )
+    torch_embeddings.embed_documents(texts[:WARMUP_SAMPLES])  # 預熱
+    reference, ref_sec = timed_embed(torch_embeddings, texts)
+    rows = [
+        {
+            "backend": "torch",
+            "threads": None,
+            "chunks_per_sec": len(texts) / ref_sec,
+            "cos_min": 1.0,
+            "cos_mean": 1.0,
+            "parity_ok": True,
+        }
+    ]
+
+    for backend, quantize in (("onnx", False), ("onnx-int8", True)):
+        for threads in ONNX_THREADS:
+            onnx = OnnxEmbeddings(
+                EMBEDDING_MODEL_NAME, quantize=quantize, num_threads=threads
+            )
+            onnx.embed_documents(texts[:WARMUP_SAMPLES])  # 預熱
+            vectors, sec = timed_embed(onnx, texts)
+            cos = (vectors * reference).sum(axis=1)
+            rows.append(
+                {
+                    "backend": backend,
+                    "threads": threads,
+                    "chunks_per_sec": len(texts) / sec,
+                    "cos_min": float(cos.min()),
+                    "cos_mean": float(cos.mean()),
+                    "parity_ok": bool(cos.min() >= PARITY_THRESHOLD[backend]),
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    df["speedup_vs_torch"] = df["chunks_per_sec"] / df.loc[0, "chunks_per_sec"]
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    print(df.to_string(index=False))
+    if not df["parity_ok"].all():
+        print("[WARN] 有 backend 未通過 parity 門檻，請勿用於建庫。")
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
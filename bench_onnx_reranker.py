@@ -0,0 +1,135 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from FlagEmbedding import FlagReranker
+
+from batch_retrieval import search_batch
+from embedding_backends import build_embeddings
+from onnx_reranker import OnnxReranker
+from query_all_report import (
+    BASE_CHROMA_PATH,
+    CANDIDATE_K,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    GUIDELINES_PATH,
+    RERANKER_MODEL_NAME,
+    TOP_N,
+    embed_guidelines,
+    get_chroma_dirs,
+    load_guidelines,
+    open_report_store,
+)
+
+# ===== 可調參數 =====
+# 固定的測試集：前 NUM_COMPANIES 家公司 × 每隔一段取 NUM_GUIDELINES 條指引 × 各自的 CANDIDATE_K 個候選
+NUM_COMPANIES = 3
+NUM_GUIDELINES = 20
+OUTPUT_CSV = "data/bench/onnx_reranker.csv"
+# (backend, intra_op threads)
+SETTINGS = [("onnx", None), ("onnx-int8", None), ("onnx-int8", 4), ("onnx-int8", 8)]
+# 每組查詢的 Spearman 平均需 ≥ 門檻、TOP_N 重疊需 ≥ 門檻
+MIN_SPEARMAN = 0.95
+MIN_TOPN_OVERLAP = 0.9
+
+
+def fixture_groups():
+    """回傳 [(公司, Definition, [chunk 文字...])]。"""
+    embeddings = build_embeddings(EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND)
+    guidelines = load_guidelines(GUIDELINES_PATH)
+    step = max(len(guidelines) // NUM_GUIDELINES, 1)
+    picked = guidelines[::step][:NUM_GUIDELINES]
+    vectors = embed_guidelines(embeddings, picked)
+    groups = []
+    for store_dir in get_chroma_dirs(BASE_CHROMA_PATH)[:NUM_COMPANIES]:
+        batch = search_batch(open_report_store(store_dir, embeddings), vectors, CANDIDATE_K)
+        for gi, item in enumerate(picked):
+            texts = [doc.page_content for doc, _ in batch.candidates(gi)]
+            if len(texts) > 1:
+                groups.append((os.path.basename(store_dir), item["Definition"], texts))
+    return groups
+
+
+def rank(x: np.ndarray) -> np.ndarray:
+    r = np.empty(len(x))
+    r[np.argsort(x)] = np.arange(len(x))
+    return r
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.corrcoef(rank(a), rank(b))[0, 1])
+
+
+def score_groups(reranker, groups):
+    pairs = [(q, t) for _, q, texts in groups for t in texts]
+    t0 = time.perf_counter()
+    flat = reranker.compute_score([list(p) for p in pairs], normalize=True)
+    sec = time.perf_counter() - t0
+    flat = np.asarray(flat if isinstance(flat, list) else [flat], dtype=np.float32)
+    out, start = [], 0
+    for _, _, texts in groups:
+        out.append(flat[start : start + len(texts)])
+        start += len(texts)
+    return out, len(pairs) / sec if sec else 0.0
+
+
+def main():
+    groups = fixture_groups()
+    if not groups:
+        print(f"[ERROR] 在 {BASE_CHROMA_PATH} 找不到可用的向量庫。")
+        return
+    print(f"[INFO] 測試集：{len(groups)} 組查詢，共 {sum(len(g[2]) for g in groups)} 組配對")
+
+    reference, torch_rate = score_groups(
+        FlagReranker(RERANKER_MODEL_NAME, use_fp16=False, device="cpu"), groups
+    )
+    rows = [{"backend": "torch", "intra_threads": None, "pairs_per_s": torch_rate}]
+    for backend, threads in SETTINGS:
+        reranker = OnnxReranker(
+            RERANKER_MODEL_NAME, quantize=backend == "onnx-int8", intra_threads=threads
+        )
+        scores, rate = score_groups(reranker, groups)
+        rho = [spearman(a, b) for a, b in zip(reference, scores)]
+        overlap = [
+            len(set(np.argsort(-a)[:TOP_N]) & set(np.argsort(-b)[:TOP_N])) / min(TOP_N, len(a))
+            for a, b in zip(reference, scores)
+        ]
+        abs_err = np.concatenate([np.abs(a - b) for a, b in zip(reference, scores)])
+        rows.append(
+            {
+                "backend": backend,
+                "intra_threads": threads,
+                "pairs_per_s": rate,
+                "speedup_vs_torch": rate / torch_rate if torch_rate else np.nan,
+                "spearman_mean": float(np.mean(rho)),
+                "spearman_min": float(np.min(rho)),
+                f"top{TOP_N}_overlap_mean": float(np.mean(overlap)),
+                "top1_agreement": float(
+                    np.mean([np.argmax(a) == np.argmax(b) for a, b in zip(reference, scores)])
+                ),
+                "max_abs_score_diff": float(abs_err.max()),
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    print(df.round(4).to_string(index=False))
+
+    failed = df[
+        (df["backend"] != "torch")
+        & (
+            (df["spearman_mean"] < MIN_SPEARMAN)
+            | (df[f"top{TOP_N}_overlap_mean"] < MIN_TOPN_OVERLAP)
+        )
+    ]
+    for _, r in failed.iterrows():
+        print(
+            f"[WARN] {r['backend']}（threads={r['intra_threads']}）排序一致性未達門檻："
+            f"Spearman {r['spearman_mean']:.3f}、TOP_{TOP_N} 重疊 {r[f'top{TOP_N}_overlap_mean']:.3f}"
+        )
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from query_all_report import GUIDELINES_PATH, OUTPUT_DIR, load_guidelines
+from result_store import DIMS_DIR, load_results, write_guidelines, write_results
+
+# ===== 可調參數 =====
+# 把現有的 CSV 輸出轉成正規化 Parquet，比較檔案大小與 LLM / 彙總階段的讀取時間
+BENCH_DIR = "data/bench/output_format"
+OUTPUT_CSV = "data/bench/output_format.csv"
+REPEATS = 3
+SUMMARY_COLUMNS = ["Company", "Label", "Rank", "是否真的有揭露此標準?(Y/N)"]
+
+
+def best_of(fn, repeats: int = REPEATS) -> float:
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for r, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(r, f))
+    return total
+
+
+def main():
+    paths = sorted(glob(os.path.join(OUTPUT_DIR, "*_output_chunks.csv")))
+    if not paths:
+        print(f"[ERROR] 在 {OUTPUT_DIR} 找不到 *_output_chunks.csv")
+        return
+
+    if os.path.exists(BENCH_DIR):
+        shutil.rmtree(BENCH_DIR)
+    os.makedirs(BENCH_DIR)
+    write_guidelines(BENCH_DIR, load_guidelines(GUIDELINES_PATH))
+    dims_dir = os.path.join(BENCH_DIR, DIMS_DIR)
+
+    rows = []
+    for csv_path in paths:
+        company = os.path.basename(csv_path).split("_output_chunks")[0]
+        df = pd.read_csv(csv_path, dtype={"Chunk ID": str})
+        pq_path = os.path.join(BENCH_DIR, f"{company}_output_chunks.parquet")
+        write_results(df, pq_path, company, dims_dir)
+
+        rows.append(
+            {
+                "Company": company,
+                "rows": len(df),
+                "csv_bytes": os.path.getsize(csv_path),
+                "parquet_fact_bytes": os.path.getsize(pq_path),
+                "parquet_chunk_dim_bytes": os.path.getsize(
+                    os.path.join(dims_dir, "chunks", f"{company}.parquet")
+                ),
+                # LLM 階段：讀完整寬表
+                "csv_full_load_s": best_of(lambda: pd.read_csv(csv_path, dtype=str)),
+                "parquet_full_load_s": best_of(lambda: load_results(pq_path)),
+                # 彙總階段：只需判斷欄位
+                "csv_summary_load_s": best_of(
+                    lambda: pd.read_csv(csv_path, usecols=SUMMARY_COLUMNS)
+                ),
+                "parquet_summary_load_s": best_of(
+                    lambda: load_results(pq_path, columns=SUMMARY_COLUMNS)
+                ),
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+
+    guideline_bytes = os.path.getsize(os.path.join(dims_dir, "guidelines.parquet"))
+    csv_total = df["csv_bytes"].sum()
+    pq_total = df["parquet_fact_bytes"].sum() + df["parquet_chunk_dim_bytes"].sum()
+    pq_total += guideline_bytes
+    print(
+        f"[INFO] {len(df)} 家公司：CSV 共 {csv_total / 1e6:.1f} MB，"
+        f"Parquet（事實表 + 維度表）共 {pq_total / 1e6:.1f} MB（{pq_total / csv_total:.1%}）"
+    )
+    for stage in ("full", "summary"):
+        csv_s = df[f"csv_{stage}_load_s"].sum()
+        pq_s = df[f"parquet_{stage}_load_s"].sum()
+        print(
+            f"[INFO] {stage} 讀取：CSV {csv_s:.2f}s，Parquet {pq_s:.2f}s"
+            f"（{csv_s / pq_s if pq_s else np.inf:.1f}x）"
+        )
+    print(
+        f"[SUCCESS] 輸出：{OUTPUT_CSV}"
+        f"（Parquet 範例在 {BENCH_DIR}，共 {dir_size(BENCH_DIR) / 1e6:.1f} MB）"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import torch
+from langchain_community.vectorstores import Chroma
+from FlagEmbedding import FlagReranker
+
+from embedding_backends import build_embeddings
+from matrix_index import MatrixIndex
+from rerank_batching import BulkReranker
+from retrieval_server import close_store
+from query_all_report import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    GUIDELINES_PATH,
+    RERANK_TOKEN_BUDGET,
+    RERANKER_MODEL_NAME,
+    embed_guidelines,
+    load_guidelines,
+    retrieve_candidates,
+)
+
+# ===== 可調參數 =====
+# 人工標註過的輸出檔：{公司}_output_chunks.xlsx，「是否真的有揭露此標準?(Y/N)」為 Y 的文本塊視為正解。
+# 公司名稱需與向量庫目錄名稱相同，且向量庫需以與標註時相同的切塊設定建立（Chunk ID 才對得上）
+ANSWER_DIR = "data/2023_query_answer"
+# 只跑這些公司；None 表示所有能對上的公司
+FIXTURE_COMPANIES = None
+STORE_PATHS = {"chroma": "chroma_report_TCFD", "matrix": "matrix_report_TCFD"}
+BACKENDS = ["chroma", "matrix"]
+RETRIEVAL_MODES = ["dense"]  # 可加入 "hybrid"、"hierarchical"
+CANDIDATE_KS = [10, 20, 30, 50]
+TOP_NS = [3, 5, 10]
+RERANK_OPTIONS = [False, True]
+OUTPUT_CSV = "data/bench/retrieval.csv"
+OUTPUT_JSON = "data/bench/retrieval.json"
+
+ANSWER_COL = "是否真的有揭露此標準?(Y/N)"
+# open：chromadb 依路徑快取已載入的索引，每家公司量完即 close_store，下一組設定才會重新載入
+STAGES = ["open", "retrieve", "rerank", "total"]
+# 分層檢索額外記錄的各層耗時
+LEVEL_STAGES = ["page", "chunk"]
+
+
+def load_ground_truth(answer_dir: str) -> dict:
+    """回傳 {公司: {Label: {Chunk ID, ...}}}，只收 Y 的文本塊。"""
+    truth = {}
+    if not os.path.isdir(answer_dir):
+        return truth
+    for fname in sorted(os.listdir(answer_dir)):
+        if not fname.endswith("_output_chunks.xlsx"):
+            continue
+        company = fname[: -len("_output_chunks.xlsx")]
+        df = pd.read_excel(os.path.join(answer_dir, fname), dtype={"Chunk ID": str})
+        df = df[df[ANSWER_COL].astype(str).str.upper().str.strip() == "Y"]
+        truth[company] = df.groupby("Label")["Chunk ID"].apply(set).to_dict()
+    return truth
+
+
+def open_store(backend: str, store_dir: str, embeddings):
+    if backend == "matrix":
+        return MatrixIndex(persist_directory=store_dir, embedding_function=embeddings)
+    db = Chroma(persist_directory=store_dir, embedding_function=embeddings)
+    # Chroma 實際載入索引是在第一次存取 collection 時
+    db._collection.count()
+    return db
+
+
+def ranked_chunk_ids(batch, guidelines, scores_by_row=None):
+    """每條指引（依列位置）依 rerank 分數（沒有 rerank 時依向量距離）排序後的 chunk_id 列表。"""
+    out = []
+    for gi in range(len(guidelines)):
+        rough = batch.candidates(gi)
+        if scores_by_row is not None:
+            order = sorted(range(len(rough)), key=lambda c: scores_by_row[gi][c], reverse=True)
+        else:
+            order = range(len(rough))
+        out.append([str(rough[c][0].metadata.get("chunk_id")) for c in order])
+    return out
+
+
+def recall_at(ranked: list, guidelines, truth: dict, n: int):
+    """同一 Label 有多列指引時，每列各自以該 Label 的正解計算。"""
+    hits = total = 0
+    for gi, item in enumerate(guidelines):
+        chunk_ids = truth.get(item["Label"])
+        if not chunk_ids:
+            continue
+        hits += len(set(ranked[gi][:n]) & chunk_ids)
+        total += len(chunk_ids)
+    return hits, total
+
+
+def run_config(backend, mode, k, rerank, companies, guidelines, vectors, embeddings, reranker):
+    per_company = []
+    for company, store_dir, truth in companies:
+        times = {}
+        t_start = time.perf_counter()
+        db = open_store(backend, store_dir, embeddings)
+        times["open"] = time.perf_counter() - t_start
+
+        t0 = time.perf_counter()
+        batch = retrieve_candidates(db, store_dir, guidelines, vectors, candidate_k=k, mode=mode)
+        times["retrieve"] = time.perf_counter() - t0
+        for level, sec in batch.timing.items():
+            times[level.replace("_s", "")] = sec
+
+        t0 = time.perf_counter()
+        scores_by_row = None
+        if rerank:
+            pairs, owners = [], []
+            for gi, item in enumerate(guidelines):
+                for doc, _ in batch.candidates(gi):
+                    pairs.append((item["Definition"], doc.page_content))
+                    owners.append(gi)
+            scores_by_row = [[] for _ in guidelines]
+            for gi, s in zip(owners, reranker.score(pairs)):
+                scores_by_row[gi].append(s)
+        times["rerank"] = time.perf_counter() - t0
+        times["total"] = time.perf_counter() - t_start
+
+        ranked = ranked_chunk_ids(batch, guidelines, scores_by_row)
+        recalls = {n: recall_at(ranked, guidelines, truth, n) for n in TOP_NS + [k]}
+        per_company.append({"company": company, "times": times, "recalls": recalls})
+        close_store(db)
+    return per_company
+
+
+def summarize(config: dict, per_company: list) -> list:
+    rows = []
+    for n in TOP_NS:
+        if n > config["candidate_k"]:
+            continue
+        hits = sum(c["recalls"][n][0] for c in per_company)
+        total = sum(c["recalls"][n][1] for c in per_company)
+        cand_hits = sum(c["recalls"][config["candidate_k"]][0] for c in per_company)
+        row = {
+            **config,
+            "top_n": n,
+            "companies": len(per_company),
+            "y_chunks": total,
+            "recall_at_top_n": hits / total if total else float("nan"),
+            "recall_in_candidates": cand_hits / total if total else float("nan"),
+        }
+        for stage in STAGES + LEVEL_STAGES:
+            if not all(stage in c["times"] for c in per_company):
+                continue
+            lat = [c["times"][stage] for c in per_company]
+            row[f"{stage}_p50_s"] = float(np.percentile(lat, 50))
+            row[f"{stage}_p95_s"] = float(np.percentile(lat, 95))
+        row["total_s"] = float(sum(c["times"]["total"] for c in per_company))
+        rows.append(row)
+    return rows
+
+
+def main():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    truth = load_ground_truth(ANSWER_DIR)
+    if FIXTURE_COMPANIES:
+        truth = {c: t for c, t in truth.items() if c in FIXTURE_COMPANIES}
+    if not truth:
+        print(f"[ERROR] 在 {ANSWER_DIR} 找不到標註檔。")
+        return
+
+    t0 = time.perf_counter()
+    embeddings = build_embeddings(EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, device=device)
+    # 量測延遲時不使用 rerank 分數快取
+    reranker = (
+        BulkReranker(
+            FlagReranker(RERANKER_MODEL_NAME, use_fp16=True, device=device),
+            RERANKER_MODEL_NAME,
+            token_budget=RERANK_TOKEN_BUDGET,
+        )
+        if any(RERANK_OPTIONS)
+        else None
+    )
+    load_sec = time.perf_counter() - t0
+    guidelines = load_guidelines(GUIDELINES_PATH)
+    t0 = time.perf_counter()
+    vectors = embed_guidelines(embeddings, guidelines)
+    embed_sec = time.perf_counter() - t0
+    print(f"[INFO] 模型載入 {load_sec:.1f}s，指引 embedding {embed_sec:.1f}s")
+
+    rows, raw = [], []
+    for backend in BACKENDS:
+        companies = []
+        for company, labels in truth.items():
+            store_dir = os.path.join(STORE_PATHS[backend], company)
+            if os.path.isdir(store_dir):
+                companies.append((company, store_dir, labels))
+            else:
+                print(f"[WARN] {backend} 沒有 {company} 的向量庫，略過。")
+        if not companies:
+            continue
+        for mode in RETRIEVAL_MODES:
+            for k in CANDIDATE_KS:
+                for rerank in RERANK_OPTIONS:
+                    config = {
+                        "backend": backend,
+                        "retrieval_mode": mode,
+                        "candidate_k": k,
+                        "rerank": rerank,
+                    }
+                    print(f"[INFO] 執行 {config}")
+                    per_company = run_config(
+                        backend, mode, k, rerank, companies, guidelines, vectors, embeddings, reranker
+                    )
+                    rows.extend(summarize(config, per_company))
+                    raw.append({**config, "per_company": per_company})
+
+    if not rows:
+        print("[ERROR] 沒有任何可執行的設定。")
+        return
+
+    df = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
+    df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "embedding_model": EMBEDDING_MODEL_NAME,
+                "embedding_backend": EMBEDDING_BACKEND,
+                "reranker_model": RERANKER_MODEL_NAME,
+                "model_load_s": load_sec,
+                "guideline_embed_s": embed_sec,
+                "summary": rows,
+                "runs": raw,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    cols = ["backend", "retrieval_mode", "candidate_k", "rerank", "top_n",
+            "recall_at_top_n", "recall_in_candidates", "total_p50_s", "total_p95_s"]
+    print(df[cols].round(4).to_string(index=False))
+    print(f"[SUCCESS] 輸出：{OUTPUT_CSV}、{OUTPUT_JSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
 import pandas as pd
 from glob import glob
+from result_store import load_results
 
 # ===== 可調參數 =====
 INPUT_DIR = "data/TCFD_report_improved_query_result/TCFD_report_improved_llm_answer_second_invocation_gpt-oss-20b"
 SUMMARY_DIR = "data/TCFD_report_improved_summary_gpt-oss-20b"
+# all_llm_answer.py 以 parquet 輸入時輸出也是 parquet，改成 .parquet 即可
 PATTERN = "*_output_chunks_fewshot_with_CoT_v2_few_shot.csv"
 TOP_K_FOR_DECISION = 5
 Y_THRESHOLD_IN_TOPK = 1  
@@ -29,9 +31,13 @@ def main():
 
     rows_detail, rows_ratio = [], []
 
+    required = {"Company", "Label", "Rank", "是否真的有揭露此標準?(Y/N)"}
     for p in paths:
-        df = pd.read_csv(p)
-        required = {"Company", "Label", "Rank", "是否真的有揭露此標準?(Y/N)"}
+        # 只讀判斷需要的欄位，不解析 Definition / Chunk Text 等大型文字欄
+        try:
+            df = load_results(p, columns=sorted(required))
+        except ValueError:
+            df = pd.read_csv(p)
         if not required.issubset(df.columns):
             print(f"[WARN] {os.path.basename(p)} 缺少必要欄位，跳過。需要：{required}")
             continue
@@ -0,0 +1,99 @@
+import random
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from lexical_index import char_ngrams
+
+# ===== 可調參數 =====
+DEFAULT_KEEP_M = 15
+# 第一階段分數 = COSINE_WEIGHT * cosine + LEXICAL_WEIGHT * 指引字元 n-gram 在文本塊中的覆蓋率
+COSINE_WEIGHT = 1.0
+LEXICAL_WEIGHT = 0.5
+# 抽樣多少比例的 (公司, 指引) 額外跑完整 rerank，用來比對 TOP_N 是否改變
+DEFAULT_AUDIT_RATE = 0.05
+
+
+class CascadeReranker:
+    """兩階段 rerank 的第一階段：以 cosine + 字元 n-gram 覆蓋率把候選剪到 keep_m 個，
+    只有留下的才送進 cross-encoder；並抽樣比對與單階段 rerank 的 TOP_N 差異。"""
+
+    def __init__(
+        self,
+        keep_m: int = DEFAULT_KEEP_M,
+        top_n: int = 5,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        seed: int = 0,
+    ):
+        # 少於 TOP_N 會讓剪掉的候選出現在輸出裡
+        self.keep_m = max(keep_m, top_n)
+        self.top_n = top_n
+        self.audit_rate = audit_rate
+        self._rng = random.Random(seed)
+        self._query_grams: Dict[str, set] = {}
+        self.stats = {
+            "rows": 0,
+            "candidates": 0,
+            "kept": 0,
+            "audited": 0,
+            "audit_changed": 0,
+            "audit_overlap": 0.0,
+        }
+
+    def _grams(self, query: str) -> set:
+        if query not in self._query_grams:
+            self._query_grams[query] = set(char_ngrams(query))
+        return self._query_grams[query]
+
+    def first_stage_scores(self, query: str, candidates) -> np.ndarray:
+        q = self._grams(str(query))
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for i, (doc, dist) in enumerate(candidates):
+            cos = 0.0 if np.isnan(dist) else 1.0 - float(dist)
+            coverage = (
+                len(q & set(char_ngrams(doc.page_content))) / len(q) if q else 0.0
+            )
+            scores[i] = COSINE_WEIGHT * cos + LEXICAL_WEIGHT * coverage
+        return scores
+
+    def select(self, query: str, candidates) -> List[int]:
+        """回傳留給 cross-encoder 的候選欄位（依原順序）。"""
+        self.stats["rows"] += 1
+        self.stats["candidates"] += len(candidates)
+        if len(candidates) <= self.keep_m:
+            self.stats["kept"] += len(candidates)
+            return list(range(len(candidates)))
+        scores = self.first_stage_scores(query, candidates)
+        keep = sorted(np.argsort(-scores, kind="stable")[: self.keep_m].tolist())
+        self.stats["kept"] += len(keep)
+        return keep
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and self._rng.random() < self.audit_rate
+
+    def _top(self, scores: Sequence[float], cols: Sequence[int]) -> set:
+        ranked = sorted(cols, key=lambda c: scores[c], reverse=True)
+        return set(ranked[: self.top_n])
+
+    def record_audit(self, full_scores: Sequence[float], kept: Sequence[int]):
+        """full_scores 為所有候選的 cross-encoder 分數。"""
+        single = self._top(full_scores, range(len(full_scores)))
+        cascade = self._top(full_scores, kept)
+        self.stats["audited"] += 1
+        self.stats["audit_changed"] += int(single != cascade)
+        self.stats["audit_overlap"] += len(single & cascade) / max(len(single), 1)
+
+    def log_stats(self):
+        s = self.stats
+        if not s["rows"]:
+            return
+        print(
+            f"[INFO] cascade rerank：{s['rows']} 組 (公司, 指引)，候選 {s['candidates']} → "
+            f"送 cross-encoder {s['kept']}（{s['kept'] / max(s['candidates'], 1):.1%}）"
+        )
+        if s["audited"]:
+            print(
+                f"[INFO] cascade 抽樣比對 {s['audited']} 組：TOP_{self.top_n} 與單階段不同 "
+                f"{s['audit_changed']} 組（{s['audit_changed'] / s['audited']:.1%}），"
+                f"平均重疊 {s['audit_overlap'] / s['audited']:.1%}"
+            )
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import unicodedata
+from typing import Dict, List
+
+import numpy as np
+
+# ===== 可調參數 =====
+# 中文沒有空白斷詞，直接以連續字元為 shingle
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+# LSH：NUM_BANDS 個 band、每個 band NUM_PERM / NUM_BANDS 列
+NUM_BANDS = 16
+DEFAULT_THRESHOLD = 0.85
+SIDECAR_FILE = "dedup_pages.json"
+
+_MERSENNE = (1 << 61) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_for_dedup(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", "", text)
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """以字元 shingle 的 crc32 做 MinHash，回傳長度 NUM_PERM 的簽章。"""
+    shingles = {
+        text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    # a < 2^31、hash < 2^32，乘積不會溢位 uint64
+    permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % _MERSENNE
+    return permuted.min(axis=0)
+
+
+def _page_of(doc) -> int:
+    return int(doc.metadata.get("page", -1))
+
+
+class ChunkDeduplicator:
+    """移除同一份報告書中完全相同或近似重複的文本塊（頁首頁尾、目錄、免責聲明等）。
+
+    保留第一次出現的文本塊，並記錄每個保留下來的文本塊出現過的所有頁碼。
+    可以分批呼叫 filter()，串流建庫時跨窗一樣有效。
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.seen = 0
+        self.removed = 0
+        self._exact: Dict[str, str] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[tuple, List[str]] = {}
+        self._pages: Dict[str, List[int]] = {}
+
+    def _find_near_duplicate(self, sig: np.ndarray):
+        rows = NUM_PERM // NUM_BANDS
+        candidates = set()
+        for b in range(NUM_BANDS):
+            key = (b, sig[b * rows : (b + 1) * rows].tobytes())
+            candidates.update(self._buckets.get(key, ()))
+        best, best_sim = None, 0.0
+        for cid in candidates:
+            sim = float(np.mean(self._signatures[cid] == sig))
+            if sim >= self.threshold and sim > best_sim:
+                best, best_sim = cid, sim
+        return best
+
+    def _index(self, chunk_id: str, sig: np.ndarray):
+        rows = NUM_PERM // NUM_BANDS
+        self._signatures[chunk_id] = sig
+        for b in range(NUM_BANDS):
+            key = (b, sig[b * rows : (b + 1) * rows].tobytes())
+            self._buckets.setdefault(key, []).append(chunk_id)
+
+    def filter(self, documents) -> list:
+        kept = []
+        for doc in documents:
+            self.seen += 1
+            chunk_id = str(doc.metadata.get("chunk_id"))
+            norm = normalize_for_dedup(doc.page_content)
+            digest = hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+            rep = self._exact.get(digest)
+            sig = None
+            if rep is None and len(norm) >= SHINGLE_SIZE:
+                sig = minhash_signature(norm)
+                rep = self._find_near_duplicate(sig)
+
+            if rep is not None:
+                self.removed += 1
+                pages = self._pages[rep]
+                if _page_of(doc) not in pages:
+                    pages.append(_page_of(doc))
+                continue
+
+            self._exact[digest] = chunk_id
+            if sig is not None:
+                self._index(chunk_id, sig)
+            self._pages[chunk_id] = [_page_of(doc)]
+            kept.append(doc)
+        return kept
+
+    def pages_map(self) -> Dict[str, List[int]]:
+        """只回傳出現在多個頁面的文本塊：chunk_id -> 排序後的頁碼。"""
+        return {cid: sorted(p) for cid, p in self._pages.items() if len(p) > 1}
+
+    def annotate(self, documents):
+        # Chroma metadata 只能是純量，頁碼清單存成逗號分隔字串
+        pages = self.pages_map()
+        for doc in documents:
+            cid = str(doc.metadata.get("chunk_id"))
+            if cid in pages:
+                doc.metadata["pages"] = ",".join(map(str, pages[cid]))
+
+
+def pages_map_from_documents(documents) -> Dict[str, List[int]]:
+    out = {}
+    for doc in documents:
+        pages = doc.metadata.get("pages")
+        if pages:
+            out[str(doc.metadata.get("chunk_id"))] = [int(p) for p in pages.split(",")]
+    return out
+
+
+def save_pages_sidecar(store_path: str, pages: Dict[str, List[int]]):
+    if not pages:
+        return
+    with open(os.path.join(store_path, SIDECAR_FILE), "w", encoding="utf-8") as f:
+        json.dump(pages, f, ensure_ascii=False)
+
+
+def load_pages_sidecar(store_path: str) -> Dict[str, List[int]]:
+    path = os.path.join(store_path, SIDECAR_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -1,12 +1,28 @@
 import os
+import json
+import time
+import queue
 import shutil
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from tqdm.auto import tqdm
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from embedding_backends import build_embeddings, log_embedding_stats
+from matrix_index import MatrixIndexWriter
+from lexical_index import LexicalIndexBuilder
+from page_index import PageIndexBuilder
+from page_cache import file_sha256, iter_cached_pages
+from chunk_dedup import (
+    ChunkDeduplicator,
+    pages_map_from_documents,
+    save_pages_sidecar,
+)
 import torch
 
 # ===== 可調參數 =====
@@ -16,6 +32,54 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 EMBEDDING_SPACE = "cosine"
 EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+# "torch" | "onnx" | "onnx-int8"；ONNX 後端給無 GPU 的批次機器用，ONNX_THREADS=None 由 ORT 自行決定
+EMBEDDING_BACKEND = "torch"
+ONNX_THREADS = None
+# "chroma"：每份報告書一個 Chroma 目錄；"matrix"：memmap 矩陣精確檢索（見 matrix_index.py）
+INDEX_BACKEND = "chroma"
+BASE_MATRIX_PATH = "matrix_report_TCFD"
+# matrix 後端的精簡儲存：截斷到前 COMPACT_DIM 維（Matryoshka）及/或 int8 量化，查詢時以精簡向量粗排再重新計分
+# COMPACT_KEEP_FLOAT32=True：float32 照存、精簡向量另外多存一份，磁碟用量比不壓縮還大，只加快粗排；
+# COMPACT_KEEP_FLOAT32=False：只存精簡向量，才真的省磁碟與載入時間，但重新計分改為查詢時重新 embed 候選
+COMPACT_DIM = None
+COMPACT_INT8 = False
+COMPACT_KEEP_FLOAT32 = True
+BASE_STORE_PATH = BASE_MATRIX_PATH if INDEX_BACKEND == "matrix" else BASE_CHROMA_PATH
+# 記錄每份 PDF 的內容雜湊與切塊參數，只重建新增或變動的報告書
+MANIFEST_PATH = f"{BASE_STORE_PATH}_manifest.json"
+# "serial"：逐份解析再 embed；"pipeline"：多行程先解析切塊，單一 embedding 工作者跨報告書湊批
+# pipeline 以整份報告書為單位傳遞文本塊：queue 中最多 PARSE_QUEUE_DEPTH 份、另有最多同樣份數正在解析，
+# 記憶體用量約為 2 × PARSE_QUEUE_DEPTH 份報告書的文本塊，不適合極大型報告書（請改用 STREAMING_INGEST）
+INGEST_MODE = "serial"
+PARSE_WORKERS = 4
+PARSE_QUEUE_DEPTH = 8
+EMBED_BATCH_SIZE = 64
+# 依 token 長度分桶、以 token 預算組批（None 則交給模型預設的固定筆數批次）
+EMBED_TOKEN_BUDGET = 16384
+LOG_EMBED_BATCHES = False
+# 逐頁串流讀取大型報告書，每 STREAM_WINDOW_PAGES 頁切塊、embed 並寫入一次（只用於 serial 模式）
+# 頁面、文本塊與向量只保留一窗；但 BM25 倒排索引、去重簽章與頁面向量仍隨文本塊數成長，
+# 在 save() 時才一次寫出（見 process_pdf_streaming 的說明）
+STREAMING_INGEST = False
+STREAM_WINDOW_PAGES = 16
+# 以 PDF 雜湊快取抽出的頁面文字（Parquet），調整切塊參數時不必重跑 PyMuPDF
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = "page_text_cache"
+# embed 前移除同一份報告書中重複 / 近似重複的文本塊（頁首頁尾、目錄、免責聲明），
+# 保留的文本塊會記錄所有出現過的頁碼（metadata "pages" 與 dedup_pages.json）
+DEDUP_CHUNKS = True
+DEDUP_THRESHOLD = 0.85
+# 同時建立字元 bigram/trigram 的 BM25 倒排索引（存在向量庫目錄下的 bm25/），供混合檢索使用
+BUILD_LEXICAL_INDEX = True
+# 同時建立頁面層級向量（該頁文本塊向量的平均，存在 page_index/），供先選頁再選文本塊的分層檢索
+BUILD_PAGE_INDEX = False
+
+# 本次執行的統計（僅主行程）
+_RUN_STATS = {"chunks_seen": 0, "chunks_removed": 0, "embedded": 0, "embed_sec": 0.0}
+# 以 (模型, 文字雜湊) 快取 embedding，重跑或調整切塊時只需計算沒看過的文本塊
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_DIR = "embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
 
 
 def find_all_pdfs(root_dir: str):
@@ -27,65 +91,513 @@ def find_all_pdfs(root_dir: str):
     return sorted(pdfs)
 
 
-def process_pdf(pdf_path: str, embeddings):
-    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    chroma_path = os.path.join(BASE_CHROMA_PATH, pdf_name)
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] manifest 讀取失敗，將全部重建：{e}")
+        return {}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    # 先寫暫存檔再 rename，避免中斷時留下半份 manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def pdf_fingerprint(pdf_path: str, previous: dict = None) -> dict:
+    stat = os.stat(pdf_path)
+    # 檔案大小與修改時間都沒變時沿用舊雜湊，避免每次都把整個 NAS 讀一遍
+    if (
+        previous
+        and previous.get("size") == stat.st_size
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+        and previous.get("sha256")
+    ):
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(pdf_path)
+    return {
+        "pdf_path": pdf_path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": (
+            EMBEDDING_MODEL_NAME
+            if EMBEDDING_BACKEND == "torch"
+            else f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_BACKEND}"
+        ),
+        "dedup": [DEDUP_CHUNKS, DEDUP_THRESHOLD],
+        "compact": [COMPACT_DIM, COMPACT_INT8, COMPACT_KEEP_FLOAT32]
+        if INDEX_BACKEND == "matrix"
+        else None,
+        "lexical": BUILD_LEXICAL_INDEX,
+        "page_index": BUILD_PAGE_INDEX,
+    }
+
+
+# 後來才加入指紋的鍵，舊紀錄缺少時視為當時的預設值，避免全部重建
+_FINGERPRINT_DEFAULTS = {"page_index": False}
+
+
+def needs_rebuild(entry: dict, fingerprint: dict, store_path: str) -> bool:
+    if not entry or not os.path.isdir(store_path):
+        return True
+    for key in (
+        "sha256",
+        "chunk_size",
+        "chunk_overlap",
+        "embedding_model",
+        "dedup",
+        "compact",
+        "lexical",
+        "page_index",
+    ):
+        if entry.get(key, _FINGERPRINT_DEFAULTS.get(key)) != fingerprint[key]:
+            return True
+    return False
 
-    print(f"[INFO] Processing PDF: {pdf_name}")
-    loader = PyMuPDFLoader(pdf_path)
-    pages = loader.load()
-    print(f"[INFO] PDF loaded. Number of pages: {len(pages)}")
 
+def remove_stale_collections(manifest: dict, pdf_names: set) -> int:
+    removed = 0
+    for name in sorted(set(manifest) - pdf_names):
+        store_path = os.path.join(BASE_STORE_PATH, name)
+        if os.path.exists(store_path):
+            print(f"[INFO] 原始 PDF 已刪除，移除向量庫：{store_path}")
+            shutil.rmtree(store_path)
+        del manifest[name]
+        removed += 1
+    return removed
+
+
+def iter_pdf_pages(pdf_path: str, sha256: str = None):
+    if USE_PAGE_CACHE:
+        return iter_cached_pages(pdf_path, PAGE_CACHE_DIR, sha256=sha256)
+    return PyMuPDFLoader(pdf_path).lazy_load()
+
+
+def iter_chunk_windows(
+    pdf_path: str,
+    window_pages: int = STREAM_WINDOW_PAGES,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    pages=None,
+    sha256: str = None,
+):
+    """逐頁讀取 PDF，每累積 window_pages 頁就切塊一次，產生 (documents, 頁數)。
+
+    splitter 對每一頁各自切塊，所以分窗切出來的文本塊與整份載入完全相同；
+    chunk_id 跨窗連續編號，page 一樣轉成從 1 開始。
+    傳入 pages 時直接切這些頁面，不再讀取 PDF；sha256 為已知的 PDF 內容雜湊（頁面快取用）。
+    """
     splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
-    documents = splitter.split_documents(pages)
+    next_chunk_id = 0
+
+    def split_window(pages):
+        nonlocal next_chunk_id
+        documents = splitter.split_documents(pages)
+        for doc in documents:
+            doc.metadata["page"] = doc.metadata.get("page", -1) + 1
+            doc.metadata["chunk_id"] = str(next_chunk_id)
+            next_chunk_id += 1
+        return documents
+
+    window = []
+    for page in pages if pages is not None else iter_pdf_pages(pdf_path, sha256):
+        window.append(page)
+        if len(window) >= window_pages:
+            yield split_window(window), len(window)
+            window = []
+    if window:
+        yield split_window(window), len(window)
+
+
+def split_pdf(pdf_path: str, sha256: str = None):
+    """解析、切塊並去重一份 PDF，回傳 (documents, 頁數, 移除的重複文本塊數)。可在子行程中執行。"""
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    print(f"[INFO] Processing PDF: {pdf_name}")
+    documents, num_pages = [], 0
+    for window_docs, window_pages in iter_chunk_windows(pdf_path, sha256=sha256):
+        documents.extend(window_docs)
+        num_pages += window_pages
+    print(f"[INFO] PDF loaded. Number of pages: {num_pages}")
     print(f"[INFO] {pdf_name} 分割後的文本塊數量：{len(documents)}")
 
-    for i, doc in enumerate(documents):
-        page_num = doc.metadata.get("page", -1) + 1
-        doc.metadata["page"] = page_num
-        doc.metadata["chunk_id"] = str(i)
+    removed = 0
+    if DEDUP_CHUNKS:
+        dedup = ChunkDeduplicator(DEDUP_THRESHOLD)
+        documents = dedup.filter(documents)
+        dedup.annotate(documents)
+        removed = dedup.removed
+    return documents, num_pages, removed
+
+
+def record_dedup(pdf_name: str, kept: int, removed: int):
+    _RUN_STATS["chunks_seen"] += kept + removed
+    _RUN_STATS["chunks_removed"] += removed
+    if DEDUP_CHUNKS:
+        total = kept + removed
+        print(
+            f"[INFO] {pdf_name} 去重：移除 {removed}/{total} 個重複文本塊"
+            f"（{removed / total if total else 0:.1%}）"
+        )
+
+
+def embed_texts(embeddings, texts):
+    t0 = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    _RUN_STATS["embed_sec"] += time.perf_counter() - t0
+    _RUN_STATS["embedded"] += len(texts)
+    return vectors
+
+
+def print_dedup_summary():
+    seen, removed = _RUN_STATS["chunks_seen"], _RUN_STATS["chunks_removed"]
+    if not DEDUP_CHUNKS or not seen:
+        return
+    ratio = removed / seen
+    per_chunk = (
+        _RUN_STATS["embed_sec"] / _RUN_STATS["embedded"]
+        if _RUN_STATS["embedded"]
+        else 0.0
+    )
+    # 只回報少 embed 的文本塊數；去重對候選與 rerank 的影響請用 bench_retrieval.py 實測
+    print(
+        f"[INFO] 去重總計：移除 {removed}/{seen} 個文本塊（{ratio:.1%}），"
+        f"少 embed {removed} 個文本塊，以本次 {per_chunk * 1000:.1f} ms/chunk 計約 {removed * per_chunk:.1f}s"
+    )
+
+
+class ChromaStoreWriter:
+    """分批寫入同一個 Chroma 目錄，介面與 MatrixIndexWriter 相同。向量已算好，直接寫入 collection。"""
+
+    def __init__(self, store_path: str):
+        if os.path.exists(store_path):
+            print(f"[INFO] Clearing existing ChromaDB at: {store_path}")
+            shutil.rmtree(store_path)
+        self._db = Chroma(
+            persist_directory=store_path,
+            collection_metadata={"hnsw:space": EMBEDDING_SPACE},
+        )
+        self._max_batch = getattr(self._db._client, "max_batch_size", None) or 5000
+
+    def add(self, documents, vectors):
+        if not documents:
+            return
+        for i in range(0, len(documents), self._max_batch):
+            part = documents[i : i + self._max_batch]
+            self._db._collection.add(
+                # chunk_id 在同一份報告書內唯一
+                ids=[str(d.metadata["chunk_id"]) for d in part],
+                embeddings=[list(map(float, v)) for v in vectors[i : i + self._max_batch]],
+                metadatas=[d.metadata for d in part],
+                documents=[d.page_content for d in part],
+            )
+
+    def close(self):
+        self._db.persist()
+
+
+class AuxIndexWriter:
+    """包住向量庫寫入器，同步累積輔助索引（BM25、頁面向量），向量庫換上正式目錄後再寫入。"""
+
+    def __init__(self, store_path: str, writer, builders):
+        self.store_path = store_path
+        self.writer = writer
+        self.builders = builders
+
+    def add(self, documents, vectors):
+        self.writer.add(documents, vectors)
+        for builder in self.builders:
+            builder.add(documents, vectors)
+
+    def close(self):
+        self.writer.close()
+        for builder in self.builders:
+            builder.save(self.store_path)
+
+
+def open_report_writer(store_path: str):
+    writer = _open_vector_writer(store_path)
+    builders = []
+    if BUILD_LEXICAL_INDEX:
+        builders.append(LexicalIndexBuilder())
+    if BUILD_PAGE_INDEX:
+        builders.append(PageIndexBuilder())
+    return AuxIndexWriter(store_path, writer, builders) if builders else writer
 
+
+def _open_vector_writer(store_path: str):
+    if INDEX_BACKEND == "matrix":
+        return MatrixIndexWriter(
+            store_path,
+            extra_info={"embedding_model": EMBEDDING_MODEL_NAME},
+            compact_dim=COMPACT_DIM,
+            compact_int8=COMPACT_INT8,
+            keep_float32=COMPACT_KEEP_FLOAT32,
+        )
+    return ChromaStoreWriter(store_path)
+
+
+def write_report_store(store_path: str, documents, vectors):
+    writer = open_report_writer(store_path)
+    writer.add(documents, vectors)
+    writer.close()
+    save_pages_sidecar(store_path, pages_map_from_documents(documents))
+
+
+def process_pdf(pdf_path: str, embeddings, sha256: str = None):
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    store_path = os.path.join(BASE_STORE_PATH, pdf_name)
+
+    documents, _, removed = split_pdf(pdf_path, sha256)
+    record_dedup(pdf_name, len(documents), removed)
     if documents:
         print("-" * 50)
         print("[INFO] Metadata of the first chunk:")
         print(documents[0].metadata)
         print("-" * 50)
 
-    if os.path.exists(chroma_path):
-        print(f"[INFO] Clearing existing ChromaDB at: {chroma_path}")
-        shutil.rmtree(chroma_path)
+    print(f"[INFO] Creating embeddings and storing in {INDEX_BACKEND} index...")
+    vectors = embed_texts(embeddings, [d.page_content for d in documents])
+    write_report_store(store_path, documents, vectors)
+    print(f"[SUCCESS] {pdf_name} 的向量庫已建立：{store_path}")
+    return len(documents)
+
+
+def process_pdf_streaming(pdf_path: str, embeddings, sha256: str = None):
+    """逐窗解析、embed、寫入；頁面、文本塊與向量只保留一窗（STREAM_WINDOW_PAGES 頁）。
+
+    以下結構仍隨整份報告書的文本塊數線性成長，直到寫入完成才釋放：
+    BUILD_LEXICAL_INDEX 的倒排索引（每個文本塊約數百個 n-gram posting）、
+    DEDUP_CHUNKS 的 MinHash 簽章與雜湊（每個保留的文本塊約 NUM_PERM 個整數）、
+    BUILD_PAGE_INDEX 的每頁向量總和，以及 MatrixIndexWriter 的 meta 列。
+    """
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    store_path = os.path.join(BASE_STORE_PATH, pdf_name)
+    print(f"[INFO] Streaming PDF: {pdf_name}（每 {STREAM_WINDOW_PAGES} 頁一窗）")
 
-    print(f"[INFO] Creating embeddings and storing in ChromaDB...")
-    db = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory=chroma_path,
-        **{"collection_metadata": {"hnsw:space": EMBEDDING_SPACE}},
+    writer = open_report_writer(store_path)
+    dedup = ChunkDeduplicator(DEDUP_THRESHOLD) if DEDUP_CHUNKS else None
+    num_pages = num_chunks = 0
+    for documents, window_pages in iter_chunk_windows(pdf_path, sha256=sha256):
+        num_pages += window_pages
+        if dedup is not None:
+            documents = dedup.filter(documents)
+        if documents:
+            vectors = embed_texts(embeddings, [d.page_content for d in documents])
+            writer.add(documents, vectors)
+            num_chunks += len(documents)
+    writer.close()
+    if dedup is not None:
+        # 已寫入的文本塊無法回頭補 metadata，重複頁碼只記在 sidecar
+        save_pages_sidecar(store_path, dedup.pages_map())
+        record_dedup(pdf_name, num_chunks, dedup.removed)
+    print(
+        f"[SUCCESS] {pdf_name} 的向量庫已建立：{store_path}"
+        f"（{num_pages} 頁、{num_chunks} 個文本塊）"
     )
-    db.persist()
-    print(f"[SUCCESS] {pdf_name} 的 ChromaDB 已建立：{chroma_path}")
+    return num_chunks
 
 
-def main():
-    load_dotenv()
-    os.makedirs(BASE_CHROMA_PATH, exist_ok=True)
+def _parse_worker(pdf_path: str, sha256: str = None):
+    try:
+        documents, num_pages, removed = split_pdf(pdf_path, sha256)
+        return pdf_path, documents, num_pages, removed, None
+    except Exception as e:
+        return pdf_path, [], 0, 0, repr(e)
+
+
+def _produce_parsed(pdf_paths, sha256s: dict, out_queue: queue.Queue, workers: int, depth: int):
+    # 子行程用 spawn，避免 fork 已初始化 CUDA / 模型的主行程
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            remaining = list(pdf_paths)
+            in_flight = set()
+            while remaining or in_flight:
+                while remaining and len(in_flight) < depth:
+                    path = remaining.pop(0)
+                    in_flight.add(pool.submit(_parse_worker, path, sha256s.get(path)))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    # queue 有上限：embedding 跟不上時在這裡阻塞，解析不會無限超前
+                    out_queue.put(fut.result())
+    finally:
+        out_queue.put(None)
+
+
+class _PendingReport:
+    def __init__(self, pdf_path: str, documents, num_pages: int):
+        self.pdf_path = pdf_path
+        self.pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        self.documents = documents
+        self.num_pages = num_pages
+        self.vectors = [None] * len(documents)
+        self.remaining = len(documents)
+
+
+def run_pipeline(pdf_paths, embeddings, on_built, sha256s: dict = None):
+    """多行程解析切塊放進有上限的 queue，主執行緒跨報告書湊滿批次後 embed 並寫入。"""
+    parsed = queue.Queue(maxsize=PARSE_QUEUE_DEPTH)
+    producer = threading.Thread(
+        target=_produce_parsed,
+        args=(pdf_paths, sha256s or {}, parsed, PARSE_WORKERS, PARSE_QUEUE_DEPTH),
+        daemon=True,
+    )
+    start = time.perf_counter()
+    producer.start()
+
+    stats = {"pages": 0, "chunks": 0, "embed_sec": 0.0}
+    buffer = []
+    progress = tqdm(total=len(pdf_paths), desc="建立向量庫 (pipeline)")
+
+    def finish(report: _PendingReport):
+        store_path = os.path.join(BASE_STORE_PATH, report.pdf_name)
+        write_report_store(store_path, report.documents, report.vectors)
+        print(f"[SUCCESS] {report.pdf_name} 的向量庫已建立：{store_path}")
+        stats["pages"] += report.num_pages
+        stats["chunks"] += len(report.documents)
+        on_built(report.pdf_path, len(report.documents))
+        progress.update(1)
+
+    def flush(batch):
+        texts = [r.documents[i].page_content for r, i in batch]
+        t0 = time.perf_counter()
+        vectors = embed_texts(embeddings, texts)
+        stats["embed_sec"] += time.perf_counter() - t0
+        for (report, i), vec in zip(batch, vectors):
+            report.vectors[i] = vec
+            report.remaining -= 1
+            if report.remaining == 0:
+                finish(report)
+
+    while True:
+        item = parsed.get()
+        if item is None:
+            break
+        pdf_path, documents, num_pages, removed, err = item
+        if err:
+            print(f"[ERROR] 解析 {pdf_path} 失敗：{err}")
+            progress.update(1)
+            continue
+        if not documents:
+            print(f"[WARN] {pdf_path} 沒有可用的文本塊，跳過。")
+            progress.update(1)
+            continue
+
+        report = _PendingReport(pdf_path, documents, num_pages)
+        record_dedup(report.pdf_name, len(documents), removed)
+        buffer.extend((report, i) for i in range(len(documents)))
+        while len(buffer) >= EMBED_BATCH_SIZE:
+            flush(buffer[:EMBED_BATCH_SIZE])
+            buffer = buffer[EMBED_BATCH_SIZE:]
+
+    if buffer:
+        flush(buffer)
+    producer.join()
+    progress.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"[INFO] pipeline 完成：{stats['pages']} 頁 / {stats['chunks']} 個文本塊，"
+        f"耗時 {elapsed:.1f}s（embedding {stats['embed_sec']:.1f}s）"
+    )
+    if elapsed > 0:
+        print(
+            f"[INFO] 吞吐量：{stats['pages'] / elapsed:.2f} pages/s，"
+            f"{stats['chunks'] / elapsed:.2f} chunks/s"
+        )
+
+
+def load_embeddings():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"[INFO] Using device: {device}")
 
-    print(f"[INFO] Initializing embedding model: {EMBEDDING_MODEL_NAME}...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME, model_kwargs={"device": device}
+    print(
+        f"[INFO] Initializing embedding model: {EMBEDDING_MODEL_NAME} "
+        f"({EMBEDDING_BACKEND})..."
     )
+    return build_embeddings(
+        EMBEDDING_MODEL_NAME,
+        backend=EMBEDDING_BACKEND,
+        device=device,
+        onnx_threads=ONNX_THREADS,
+        use_cache=USE_EMBEDDING_CACHE,
+        cache_dir=EMBEDDING_CACHE_DIR,
+        cache_max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        token_budget=EMBED_TOKEN_BUDGET,
+        log_batches=LOG_EMBED_BATCHES,
+    )
+
+
+def main():
+    load_dotenv()
+    os.makedirs(BASE_STORE_PATH, exist_ok=True)
+    embeddings = load_embeddings()
 
     pdf_paths = find_all_pdfs(PDF_ROOT)
     if not pdf_paths:
         print(f"[ERROR] 在 {PDF_ROOT} 找不到任何 PDF。")
         return
     print(f"[INFO] 共找到 {len(pdf_paths)} 份 PDF。")
-    for p in tqdm(pdf_paths, desc="建立 ChromaDB"):
-        process_pdf(p, embeddings)
+
+    manifest = load_manifest()
+    pdf_names = {os.path.splitext(os.path.basename(p))[0] for p in pdf_paths}
+    removed = remove_stale_collections(manifest, pdf_names)
+    if removed:
+        save_manifest(manifest)
+
+    skipped = 0
+    fingerprints = {}
+    for p in pdf_paths:
+        pdf_name = os.path.splitext(os.path.basename(p))[0]
+        store_path = os.path.join(BASE_STORE_PATH, pdf_name)
+        entry = manifest.get(pdf_name)
+        fingerprint = pdf_fingerprint(p, entry)
+        if needs_rebuild(entry, fingerprint, store_path):
+            fingerprints[p] = fingerprint
+        else:
+            skipped += 1
+
+    rebuilt = 0
+
+    def on_built(pdf_path: str, num_chunks: int):
+        nonlocal rebuilt
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        manifest[pdf_name] = {
+            **fingerprints[pdf_path],
+            "num_chunks": num_chunks,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        # 每份完成就寫回，中途中斷也不會遺失已建好的進度
+        save_manifest(manifest)
+        rebuilt += 1
+
+    todo = list(fingerprints)
+    # 指紋裡的 sha256 直接給頁面快取用，不必再讀一次 PDF
+    sha256s = {p: fingerprints[p]["sha256"] for p in todo}
+    if INGEST_MODE == "pipeline":
+        run_pipeline(todo, embeddings, on_built, sha256s)
+    else:
+        build = process_pdf_streaming if STREAMING_INGEST else process_pdf
+        for p in tqdm(todo, desc="建立向量庫"):
+            on_built(p, build(p, embeddings, sha256s[p]))
+
+    print(
+        f"[INFO] 增量建庫完成：略過 {skipped} 份、重建 {rebuilt} 份、移除 {removed} 份。"
+    )
+    print_dedup_summary()
+    log_embedding_stats(embeddings)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from embedding_cache import CachedEmbeddings, DEFAULT_CACHE_DIR, DEFAULT_MAX_ENTRIES
+from embedding_batching import TokenBudgetEmbeddings
+
+# "torch"：HuggingFaceEmbeddings；"onnx"：ONNX Runtime float32；"onnx-int8"：ONNX Runtime 動態 int8
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# 使用 token 預算組批時，底層模型每次呼叫只跑一個 batch
+_SINGLE_BATCH = 100_000
+
+
+def build_embeddings(
+    model_name: str,
+    backend: str = "torch",
+    device: str = "cpu",
+    onnx_threads: int = None,
+    use_cache: bool = True,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    cache_max_entries: int = DEFAULT_MAX_ENTRIES,
+    token_budget: int = None,
+    log_batches: bool = False,
+):
+    """建立 embedding 物件：backend → (token 預算分桶組批) → (磁碟快取)。"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的 embedding backend：{backend}，可用：{BACKENDS}")
+
+    if backend == "torch":
+        encode_kwargs = {"batch_size": _SINGLE_BATCH} if token_budget else {}
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            encode_kwargs=encode_kwargs,
+        )
+    else:
+        from onnx_embeddings import OnnxEmbeddings, DEFAULT_BATCH_SIZE
+
+        embeddings = OnnxEmbeddings(
+            model_name,
+            quantize=backend == "onnx-int8",
+            num_threads=onnx_threads,
+            batch_size=_SINGLE_BATCH if token_budget else DEFAULT_BATCH_SIZE,
+        )
+
+    if token_budget:
+        embeddings = TokenBudgetEmbeddings(
+            embeddings, model_name, token_budget=token_budget, log_batches=log_batches
+        )
+
+    if not use_cache:
+        return embeddings
+    # 不同 backend 算出的向量有些微差異，快取鍵需分開
+    cache_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+    return CachedEmbeddings(
+        embeddings, cache_name, cache_dir=cache_dir, max_entries=cache_max_entries
+    )
+
+
+def log_embedding_stats(embeddings):
+    """依序印出包裝鏈上（快取、分桶組批）各層的統計。"""
+    layer = embeddings
+    while layer is not None:
+        if hasattr(layer, "log_stats"):
+            layer.log_stats()
+        layer = getattr(layer, "base", None)
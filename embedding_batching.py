@@ -0,0 +1,131 @@
+import time
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from transformers import AutoTokenizer
+
+# ===== 可調參數 =====
+DEFAULT_TOKEN_BUDGET = 16384
+DEFAULT_MAX_LENGTH = 8192
+# 對照組：HuggingFaceEmbeddings 實際的批次方式——SentenceTransformer.encode 在每次呼叫內
+# 依字元長度由長到短排序，再以 encode 預設的 batch_size 固定筆數分批
+ENCODE_BATCH_SIZE = 32
+
+
+def padding_efficiency(lengths: List[int]) -> float:
+    """實際 token 數 / 補齊到最長後的 token 數。"""
+    if not lengths:
+        return 1.0
+    return sum(lengths) / (len(lengths) * max(lengths))
+
+
+def encode_padded_tokens(texts: List[str], lengths: List[int], batch_size: int) -> int:
+    """SentenceTransformer.encode 的批次方式下，補齊後的 token 總數。"""
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    total = 0
+    for start in range(0, len(order), batch_size):
+        batch = [lengths[i] for i in order[start : start + batch_size]]
+        total += len(batch) * max(batch)
+    return total
+
+
+def plan_batches(lengths: List[int], token_budget: int) -> List[List[int]]:
+    """依 token 長度由長到短排序，在 batch_size × 最長長度 ≤ token_budget 的前提下盡量塞滿。"""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches, current, current_max = [], [], 0
+    for i in order:
+        longest = max(current_max, lengths[i])
+        if current and longest * (len(current) + 1) > token_budget:
+            batches.append(current)
+            current, longest = [], lengths[i]
+        current.append(i)
+        current_max = longest
+    if current:
+        batches.append(current)
+    return batches
+
+
+class TokenBudgetEmbeddings(Embeddings):
+    """先依 token 長度分桶、以 token 預算組批再 embed，最後還原原本順序。
+
+    base 每次 embed_documents 應視為一個 forward batch
+    （HuggingFaceEmbeddings / OnnxEmbeddings 需把自身 batch_size 設得夠大）。
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        log_batches: bool = False,
+    ):
+        self.base = base
+        self.token_budget = token_budget
+        self.max_length = max_length
+        self.log_batches = log_batches
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.stats = {
+            "texts": 0,
+            "batches": 0,
+            "tokens": 0,
+            "padded_tokens": 0,
+            "encode_padded_tokens": 0,
+            "seconds": 0.0,
+        }
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        ids = self.tokenizer(texts, add_special_tokens=True, truncation=False)[
+            "input_ids"
+        ]
+        return [min(len(x), self.max_length) for x in ids]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        if not texts:
+            return []
+        lengths = self.token_lengths(texts)
+        out: List[List[float]] = [None] * len(texts)
+
+        for n, batch in enumerate(plan_batches(lengths, self.token_budget), start=1):
+            batch_lengths = [lengths[i] for i in batch]
+            t0 = time.perf_counter()
+            vectors = self.base.embed_documents([texts[i] for i in batch])
+            sec = time.perf_counter() - t0
+            for i, vec in zip(batch, vectors):
+                out[i] = vec
+
+            real = sum(batch_lengths)
+            padded = len(batch) * max(batch_lengths)
+            self.stats["batches"] += 1
+            self.stats["tokens"] += real
+            self.stats["padded_tokens"] += padded
+            self.stats["seconds"] += sec
+            if self.log_batches:
+                print(
+                    f"[DEBUG] embed batch {n}: {len(batch)} 筆、最長 {max(batch_lengths)} tokens，"
+                    f"padding 效率 {real / padded:.1%}，{real / sec if sec else 0:.0f} tokens/s"
+                )
+
+        self.stats["texts"] += len(texts)
+        self.stats["encode_padded_tokens"] += encode_padded_tokens(
+            texts, lengths, ENCODE_BATCH_SIZE
+        )
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def log_stats(self):
+        s = self.stats
+        if not s["batches"]:
+            return
+        eff = s["tokens"] / s["padded_tokens"]
+        baseline = s["tokens"] / s["encode_padded_tokens"]
+        tps = s["tokens"] / s["seconds"] if s["seconds"] else 0.0
+        print(
+            f"[INFO] 長度分桶批次：{s['texts']} 筆 / {s['batches']} 批，"
+            f"padding 效率 {eff:.1%}（SentenceTransformer.encode 排序後每 {ENCODE_BATCH_SIZE} 筆一批為 "
+            f"{baseline:.1%}，吞吐量差異請用 bench_embedding_batching.py 實測），"
+            f"{tps:.0f} tokens/s"
+        )
@@ -0,0 +1,251 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# ===== 可調參數 =====
+DEFAULT_CACHE_DIR = "embedding_cache"
+DEFAULT_MAX_ENTRIES = 500_000
+# 空間不足時一次淘汰的比例，避免每寫一筆就掃一次 LRU
+EVICT_FRACTION = 0.01
+_SQLITE_MAX_VARS = 900
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_key(model_name: str, kind: str, text: str) -> str:
+    raw = f"{model_name}\0{kind}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """以 (模型名稱, 正規化文字雜湊) 為鍵的磁碟 embedding 快取。
+
+    索引存在 SQLite，向量存在固定容量的 memmap float32 陣列，
+    超過 max_entries 時依最後使用時間 (LRU) 淘汰。
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.base = base
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        safe_name = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+        self.cache_dir = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self._vectors: Optional[np.memmap] = None
+
+        self._conn = sqlite3.connect(
+            os.path.join(self.cache_dir, "index.sqlite"),
+            timeout=60,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lru ON entries(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta VALUES ('capacity', ?)", (max_entries,)
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('next_slot', 0)")
+
+        self.capacity = self._meta("capacity")
+        if self.capacity != max_entries:
+            print(
+                f"[WARN] 快取 {self.cache_dir} 已以容量 {self.capacity} 建立，"
+                f"忽略新的 max_entries={max_entries}"
+            )
+        # 向量檔在第一次讀寫的交易中才開啟 / 建立（見 _ensure_vectors）
+
+    # ---------- Embeddings 介面 ----------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "doc", self.base.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(
+            [text], "query", lambda ts: [self.base.embed_query(ts[0])]
+        )[0]
+
+    # ---------- 統計 ----------
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "capacity": self.capacity,
+        }
+
+    def log_stats(self, prefix: str = "embedding 快取"):
+        s = self.stats()
+        print(
+            f"[INFO] {prefix}：命中 {s['hits']}、未命中 {s['misses']}"
+            f"（命中率 {s['hit_rate']:.1%}），已存 {s['entries']}/{s['capacity']} 筆"
+        )
+
+    # ---------- 內部實作 ----------
+    def _meta(self, name: str) -> int:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def _ensure_vectors(self, dim: Optional[int] = None):
+        """開啟向量檔；尚未建立且給了 dim 時記錄維度並建立。只能在 BEGIN IMMEDIATE 交易內呼叫。"""
+        if self._vectors is not None:
+            return
+        stored = self._meta("dim")
+        if not stored:
+            if not dim:
+                return
+            self._conn.execute("INSERT INTO meta VALUES ('dim', ?)", (dim,))
+            stored = dim
+        # 持有寫入鎖時才建立檔案，其他行程不會同時建立或截斷它
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, stored)
+        )
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _SQLITE_MAX_VARS):
+            part = unique[i : i + _SQLITE_MAX_VARS]
+            marks = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({marks})", part
+            ).fetchall()
+            found.update(rows)
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, k) for k in found],
+            )
+        return found
+
+    def _embed(self, texts: List[str], kind: str, compute) -> List[List[float]]:
+        keys = [text_key(self.model_name, kind, t) for t in texts]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        miss_texts = {}
+        with self._lock:
+            # 查 slot 與讀向量都在寫入鎖內，其他行程不會在讀取途中淘汰並覆寫同一個 slot
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._ensure_vectors()
+                found = self._lookup(keys) if self._vectors is not None else {}
+                for i, key in enumerate(keys):
+                    if key in found:
+                        out[i] = self._vectors[found[key]].tolist()
+                    else:
+                        miss_texts.setdefault(key, texts[i])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        # 同一次呼叫中重複的文字只算一次未命中
+        self.misses += len(miss_texts)
+        self.hits += len(texts) - len(miss_texts)
+
+        if miss_texts:
+            miss_keys = list(miss_texts)
+            computed = compute([miss_texts[k] for k in miss_keys])
+            fresh = dict(zip(miss_keys, computed))
+            with self._lock:
+                self._store(fresh)
+            for i, key in enumerate(keys):
+                if out[i] is None:
+                    out[i] = list(fresh[key])
+        return out
+
+    def _allocate_slots(self, n: int) -> List[int]:
+        slots = [
+            r[0]
+            for r in self._conn.execute(
+                "SELECT slot FROM free_slots LIMIT ?", (n,)
+            ).fetchall()
+        ]
+        self._conn.executemany(
+            "DELETE FROM free_slots WHERE slot = ?", [(s,) for s in slots]
+        )
+
+        next_slot = self._meta("next_slot")
+        take = min(n - len(slots), self.capacity - next_slot)
+        if take > 0:
+            slots.extend(range(next_slot, next_slot + take))
+            self._conn.execute(
+                "UPDATE meta SET value = ? WHERE name = 'next_slot'",
+                (next_slot + take,),
+            )
+
+        short = n - len(slots)
+        if short > 0:
+            evict_n = max(short, int(self.capacity * EVICT_FRACTION))
+            victims = self._conn.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict_n,)
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims]
+            )
+            freed = [s for _, s in victims]
+            slots.extend(freed[:short])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO free_slots VALUES (?)",
+                [(s,) for s in freed[short:]],
+            )
+        return slots
+
+    def _store(self, fresh: dict):
+        if not fresh:
+            return
+        # BEGIN IMMEDIATE：多個行程共用同一份快取時，配置 slot 不會互相覆蓋
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._ensure_vectors(len(next(iter(fresh.values()))))
+            items = list(fresh.items())
+            existing = self._lookup([k for k, _ in items])
+            items = [(k, v) for k, v in items if k not in existing]
+            items = items[: self.capacity]
+            slots = self._allocate_slots(len(items))
+            now = time.time()
+            for (key, vec), slot in zip(items, slots):
+                self._vectors[slot] = np.asarray(vec, dtype=np.float32)
+            self._vectors.flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                [(key, slot, now) for (key, _), slot in zip(items, slots)],
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
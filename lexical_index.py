@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import math
+import shutil
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ===== 可調參數 =====
+# 中文不斷詞，直接以字元 bigram / trigram 當詞彙
+NGRAM_SIZES = (2, 3)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 與向量庫放在同一個報告書目錄下
+LEXICAL_DIR = "bm25"
+
+
+def char_ngrams(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", "", text)
+    grams = []
+    for n in NGRAM_SIZES:
+        grams.extend(text[i : i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def lexical_index_path(store_path: str) -> str:
+    return os.path.join(store_path, LEXICAL_DIR)
+
+
+class LexicalIndexBuilder:
+    """建庫時逐批加入文本塊，save() 時寫成 CSR 形式的倒排索引。"""
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._postings: List[List[Tuple[int, int]]] = []
+        self._doc_len: List[int] = []
+        self._chunk_ids: List[str] = []
+
+    def add(self, documents, vectors=None):
+        for doc in documents:
+            doc_idx = len(self._doc_len)
+            counts = Counter(char_ngrams(doc.page_content))
+            for term, tf in counts.items():
+                tid = self._vocab.get(term)
+                if tid is None:
+                    tid = self._vocab[term] = len(self._postings)
+                    self._postings.append([])
+                self._postings[tid].append((doc_idx, tf))
+            self._doc_len.append(sum(counts.values()))
+            self._chunk_ids.append(str(doc.metadata.get("chunk_id")))
+
+    def save(self, store_path: str):
+        path = lexical_index_path(store_path)
+        tmp = f"{path}.tmp"
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        lengths = [len(p) for p in self._postings]
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        docs = np.fromiter(
+            (d for p in self._postings for d, _ in p), dtype=np.int32, count=indptr[-1]
+        )
+        tfs = np.fromiter(
+            (tf for p in self._postings for _, tf in p),
+            dtype=np.int32,
+            count=indptr[-1],
+        )
+        np.save(os.path.join(tmp, "indptr.npy"), indptr)
+        np.save(os.path.join(tmp, "docs.npy"), docs)
+        np.save(os.path.join(tmp, "tfs.npy"), tfs)
+        np.save(os.path.join(tmp, "doc_len.npy"), np.asarray(self._doc_len, np.int32))
+        with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self._vocab, f, ensure_ascii=False)
+        with open(os.path.join(tmp, "chunk_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self._chunk_ids, f)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+
+class LexicalIndex:
+    """BM25 倒排索引；建構時不讀檔，第一次查詢才載入（陣列以 memmap 開啟）。"""
+
+    def __init__(self, store_path: str):
+        self.path = lexical_index_path(store_path)
+        self._loaded = False
+
+    @staticmethod
+    def exists(store_path: str) -> bool:
+        return os.path.exists(os.path.join(lexical_index_path(store_path), "vocab.json"))
+
+    def _load(self):
+        if self._loaded:
+            return
+        self.indptr = np.load(os.path.join(self.path, "indptr.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(self.path, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(self.path, "tfs.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(self.path, "doc_len.npy"))
+        with open(os.path.join(self.path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        with open(os.path.join(self.path, "chunk_ids.json"), "r", encoding="utf-8") as f:
+            self.chunk_ids: List[str] = json.load(f)
+        self.num_docs = len(self.doc_len)
+        self.avg_len = float(self.doc_len.mean()) if self.num_docs else 0.0
+        self._loaded = True
+
+    def scores(self, query: str) -> np.ndarray:
+        self._load()
+        out = np.zeros(self.num_docs, dtype=np.float32)
+        if not self.num_docs:
+            return out
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(self.avg_len, 1e-9))
+        for term, qtf in Counter(char_ngrams(query)).items():
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            start, end = int(self.indptr[tid]), int(self.indptr[tid + 1])
+            docs = np.asarray(self.docs[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            out[docs] += qtf * idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        return out
+
+    def search(self, queries: List[str], k: int) -> Tuple[List[List[str]], List[List[float]]]:
+        """回傳每個查詢前 k 個 (chunk_id, BM25 分數)，只包含分數 > 0 的文本塊。"""
+        self._load()
+        all_ids, all_scores = [], []
+        for q in queries:
+            s = self.scores(q)
+            kk = min(k, int((s > 0).sum()))
+            if kk == 0:
+                all_ids.append([])
+                all_scores.append([])
+                continue
+            top = np.argpartition(-s, kk - 1)[:kk]
+            top = top[np.argsort(-s[top])]
+            all_ids.append([self.chunk_ids[i] for i in top])
+            all_scores.append([float(s[i]) for i in top])
+        return all_ids, all_scores
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]], k: int, rrf_k: int = 60
+) -> List[str]:
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            fused[cid] = fused.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+    return [cid for cid, _ in sorted(fused.items(), key=lambda x: -x[1])[:k]]
+
+
+def load_lexical_index(store_path: str) -> Optional[LexicalIndex]:
+    return LexicalIndex(store_path) if LexicalIndex.exists(store_path) else None
@@ -13,6 +13,12 @@ from typing import List, Optional
 from collections import Counter
 from tenacity import retry, stop_after_attempt
 from langchain_core.prompts import ChatPromptTemplate
+from llm_cache import LLMResponseCache
+
+SYSTEM_PROMPT = "你是一位專業的 TCFD 揭露標準判讀專家。請根據以下內容判斷是否有揭露該標準。"
+# 判讀結果快取；LLM_CACHE_BYPASS=True 時強制重判並覆寫快取
+USE_LLM_CACHE = True
+LLM_CACHE_BYPASS = False
 
 class Result(BaseModel):
     reasoning: Optional[str] = None
@@ -25,7 +31,14 @@ def get_prompt(chunk: str, label: str, positive_example1: str, positive_example2
     return PROMPT.format(chunk=chunk, label=label, positive_example1=positive_example1, positive_example2=positive_example2)
 
 @retry(stop=stop_after_attempt(3))
-def get_llm_answer(chunk: str, label: str, positive_example1: str, positive_example2: str):
+def get_llm_answer(chunk: str, label: str, positive_example1: str, positive_example2: str, cache: Optional[LLMResponseCache] = None):
+    prompt = get_prompt(chunk, label, positive_example1, positive_example2)
+    # system prompt 也會影響輸出，一起納入快取鍵
+    cache_key = f"{SYSTEM_PROMPT}\n\n{prompt}"
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
     try:
         load_dotenv()
         llm = ChatOpenAI(
@@ -34,21 +47,22 @@ def get_llm_answer(chunk: str, label: str, positive_example1: str, positive_exam
         )
         parser = PydanticOutputParser(pydantic_object=ResultList)
         prompt_template = ChatPromptTemplate.from_messages([
-            ("system", "你是一位專業的 TCFD 揭露標準判讀專家。請根據以下內容判斷是否有揭露該標準。"),
+            ("system", SYSTEM_PROMPT),
             ("human", "{input}"),
         ])
         chain = prompt_template | llm | parser
-        prompt = get_prompt(chunk, label, positive_example1, positive_example2)
         response = chain.invoke({"input": prompt})
         result = response.model_dump()
+        if cache is not None:
+            cache.put(cache_key, result)
         return result
     except Exception as e:
         print(f"Error occurred: {e}")
         return None
 
 MAX_WORKERS = 10
-def process_row(idx, chunk, label, positive_example1, positive_example2):
-    result_dict = get_llm_answer(chunk, label, positive_example1, positive_example2)
+def process_row(idx, chunk, label, positive_example1, positive_example2, cache=None):
+    result_dict = get_llm_answer(chunk, label, positive_example1, positive_example2, cache)
     return idx, result_dict
 
 def process_tcfd_file(
@@ -76,10 +90,13 @@ def process_tcfd_file(
             df.at[idx, 'reasoning'] = ""
             df.at[idx, yn_col]    = ""
 
+    # ChatOpenAI 未指定 temperature，沿用 API 預設
+    cache = LLMResponseCache("openai", "gpt-4o-mini", bypass=LLM_CACHE_BYPASS) if USE_LLM_CACHE else None
+
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         # submit all tasks
         future_to_idx = {
-            executor.submit(process_row, idx, chunk, label, positive_example1, positive_example2): idx
+            executor.submit(process_row, idx, chunk, label, positive_example1, positive_example2, cache): idx
             for idx, chunk, label, positive_example1, positive_example2 in tasks
         }
         for future in tqdm(as_completed(future_to_idx), total=len(future_to_idx), desc="並行呼叫 LLM"):
@@ -106,6 +123,8 @@ def process_tcfd_file(
 
     df.to_csv(output_csv, index=False, encoding="utf-8-sig")
     print(f"已儲存結果至：{output_csv}")
+    if cache is not None:
+        cache.log_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+from async_llm_engine import estimate_tokens
+
+# ===== 可調參數 =====
+DEFAULT_CACHE_PATH = "llm_response_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 500_000
+# 超過天數的回覆視為過期；None 表示永不過期
+DEFAULT_TTL_DAYS = 90
+# 超過上限時多淘汰一些，避免每次寫入都觸發淘汰
+EVICT_FRACTION = 0.05
+# 每寫入幾筆才做一次過期清除與筆數檢查（上限可能暫時多出這麼多筆）
+EVICT_EVERY = 1000
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """以 (backend, 模型, temperature, 完整 prompt 雜湊) 為鍵的 LLM 判讀快取。
+
+    只存成功解析的結果；bypass=True 時不讀快取但仍寫入（等同強制重新判讀並更新）。
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        model: str,
+        temperature: Optional[float] = None,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_days: Optional[float] = DEFAULT_TTL_DAYS,
+        bypass: bool = False,
+    ):
+        self.key = (backend, model, "default" if temperature is None else repr(float(temperature)))
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=60, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "backend TEXT NOT NULL, model TEXT NOT NULL, temperature TEXT NOT NULL, "
+            "prompt_hash TEXT NOT NULL, response TEXT NOT NULL, tokens INTEGER, "
+            "created REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (backend, model, temperature, prompt_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses(last_used)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created)"
+        )
+        self._puts = 0
+        self._evict(time.time())
+
+    def get(self, prompt: str) -> Optional[dict]:
+        if self.bypass:
+            self.misses += 1
+            return None
+        h = prompt_hash(prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, tokens, created FROM responses "
+                "WHERE backend = ? AND model = ? AND temperature = ? AND prompt_hash = ?",
+                (*self.key, h),
+            ).fetchone()
+            if row is not None and self.ttl is not None and row[2] < now - self.ttl:
+                row = None
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? "
+                    "WHERE backend = ? AND model = ? AND temperature = ? AND prompt_hash = ?",
+                    (now, *self.key, h),
+                )
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # 舊版呼叫拿不到實際用量時以估計值計
+        self.saved_tokens += row[1] or estimate_tokens(prompt)
+        return json.loads(row[0])
+
+    def put(self, prompt: str, response: dict, tokens: Optional[int] = None):
+        now = time.time()
+        row = (
+            *self.key,
+            prompt_hash(prompt),
+            json.dumps(response, ensure_ascii=False),
+            tokens,
+            now,
+            now,
+        )
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+                self._puts += 1
+                if self._puts % EVICT_EVERY == 0:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float):
+        """清除過期紀錄並依最後使用時間淘汰；啟動時與每 EVICT_EVERY 次寫入才執行。"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        n = count - self.max_entries + int(self.max_entries * EVICT_FRACTION)
+        self._conn.execute(
+            "DELETE FROM responses WHERE rowid IN "
+            "(SELECT rowid FROM responses ORDER BY last_used LIMIT ?)",
+            (n,),
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        # 只在執行結束印統計時呼叫一次，直接數實際筆數
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        print(
+            f"[INFO] LLM 回覆快取{'（bypass）' if self.bypass else ''}：命中 {s['hits']}、"
+            f"未命中 {s['misses']}（命中率 {s['hit_rate']:.1%}），省下約 {s['saved_tokens']} tokens，"
+            f"已存 {s['entries']}/{s['max_entries']} 筆"
+        )
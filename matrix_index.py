@@ -0,0 +1,323 @@
+import os
+import json
+import shutil
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from chunk_dedup import load_pages_sidecar
+
+# 每份報告書一個目錄：
+#   vectors.f32  正規化後的 float32 向量，row-major，可直接 memmap
+#   texts.bin    所有文本塊 utf-8 串接
+#   meta.npy     (page, chunk_id, text_offset, text_len) 結構化陣列
+#   index.json   維度、筆數等描述
+# 去重時合併的頁碼另存在 chunk_dedup 的 dedup_pages.json，get_document 會放回 metadata "pages"
+# 選用的精簡表示（Matryoshka 截斷前 compact_dim 維，可再做逐列 int8 量化）：
+#   compact.i8 / compact.f32   截斷後的向量
+#   compact_scales.f32         int8 時每列的反量化比例
+VECTORS_FILE = "vectors.f32"
+TEXTS_FILE = "texts.bin"
+META_FILE = "meta.npy"
+INFO_FILE = "index.json"
+COMPACT_I8_FILE = "compact.i8"
+COMPACT_F32_FILE = "compact.f32"
+COMPACT_SCALES_FILE = "compact_scales.f32"
+# 精簡向量先取 k * 倍數 個候選，再以 float32 重新計分取前 k
+DEFAULT_RESCORE_MULTIPLIER = 4
+
+META_DTYPE = np.dtype(
+    [
+        ("page", np.int32),
+        ("chunk_id", np.int32),
+        ("text_offset", np.int64),
+        ("text_len", np.int32),
+    ]
+)
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def compact_vectors(
+    mat: np.ndarray, dim: Optional[int], int8: bool
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """截斷到前 dim 維並重新正規化；int8 時以每列最大絕對值做對稱量化。"""
+    mat = normalize_rows(mat[:, :dim] if dim else mat)
+    if not int8:
+        return mat, None
+    scales = np.abs(mat).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(mat / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def compact_scores(
+    queries: np.ndarray, codes: np.ndarray, scales: Optional[np.ndarray]
+) -> np.ndarray:
+    q = normalize_rows(queries[:, : codes.shape[1]])
+    sims = q @ np.asarray(codes, dtype=np.float32).T
+    if scales is not None:
+        sims *= np.asarray(scales)[None, :]
+    return sims
+
+
+def top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """對每一列取分數最高的 k 個，回傳依分數遞減排序的 (ids, 分數)。"""
+    n = sims.shape[1]
+    k = min(k, n)
+    if k == 0:
+        empty = np.zeros((sims.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < n:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (sims.shape[0], 1))
+    part_sims = np.take_along_axis(sims, part, axis=1)
+    order = np.argsort(-part_sims, axis=1)
+    return (
+        np.take_along_axis(part, order, axis=1),
+        np.take_along_axis(part_sims, order, axis=1),
+    )
+
+
+def is_matrix_index(path: str) -> bool:
+    return os.path.exists(os.path.join(path, INFO_FILE))
+
+
+class MatrixIndexWriter:
+    """依序寫入一份報告書的向量與 metadata，close() 時才換上正式目錄。"""
+
+    def __init__(
+        self,
+        path: str,
+        extra_info: Optional[dict] = None,
+        compact_dim: Optional[int] = None,
+        compact_int8: bool = False,
+        keep_float32: bool = True,
+    ):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+        self.compact = bool(compact_dim or compact_int8)
+        self.compact_dim = compact_dim
+        self.compact_int8 = compact_int8
+        # 沒有精簡表示時一定要保留 float32
+        self.keep_float32 = keep_float32 or not self.compact
+        self._vectors = (
+            open(os.path.join(self.tmp_path, VECTORS_FILE), "wb")
+            if self.keep_float32
+            else None
+        )
+        self._compact = None
+        self._scales = None
+        if self.compact:
+            name = COMPACT_I8_FILE if compact_int8 else COMPACT_F32_FILE
+            self._compact = open(os.path.join(self.tmp_path, name), "wb")
+            if compact_int8:
+                self._scales = open(
+                    os.path.join(self.tmp_path, COMPACT_SCALES_FILE), "wb"
+                )
+        self._texts = open(os.path.join(self.tmp_path, TEXTS_FILE), "wb")
+        self._meta: List[tuple] = []
+        self._offset = 0
+        self.dim: Optional[int] = None
+        self.extra_info = extra_info or {}
+
+    def add(self, documents: List[Document], vectors):
+        if not documents:
+            return
+        mat = normalize_rows(vectors)
+        if self.dim is None:
+            self.dim = mat.shape[1]
+        elif mat.shape[1] != self.dim:
+            raise ValueError(f"向量維度不一致：{mat.shape[1]} != {self.dim}")
+        if self._vectors is not None:
+            self._vectors.write(np.ascontiguousarray(mat).tobytes())
+        if self._compact is not None:
+            codes, scales = compact_vectors(mat, self.compact_dim, self.compact_int8)
+            self._compact.write(np.ascontiguousarray(codes).tobytes())
+            if self._scales is not None:
+                self._scales.write(scales.tobytes())
+
+        for doc in documents:
+            raw = doc.page_content.encode("utf-8")
+            self._texts.write(raw)
+            self._meta.append(
+                (
+                    int(doc.metadata.get("page", -1)),
+                    int(doc.metadata.get("chunk_id", -1)),
+                    self._offset,
+                    len(raw),
+                )
+            )
+            self._offset += len(raw)
+
+    def close(self):
+        for f in (self._vectors, self._compact, self._scales, self._texts):
+            if f is not None:
+                f.close()
+        np.save(
+            os.path.join(self.tmp_path, META_FILE),
+            np.array(self._meta, dtype=META_DTYPE),
+        )
+        info = {
+            "dim": self.dim or 0,
+            "count": len(self._meta),
+            "has_float32": self.keep_float32,
+            **self.extra_info,
+        }
+        if self.compact:
+            info["compact"] = {
+                "dim": min(self.compact_dim or self.dim or 0, self.dim or 0),
+                "int8": self.compact_int8,
+            }
+        with open(os.path.join(self.tmp_path, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+
+
+class MatrixIndex:
+    """以 memmap 矩陣做精確 cosine 檢索，介面對齊 Chroma 常用的查詢方法。"""
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function=None,
+        rescore_multiplier: int = DEFAULT_RESCORE_MULTIPLIER,
+    ):
+        self.path = persist_directory
+        self.embedding_function = embedding_function
+        self.rescore_multiplier = rescore_multiplier
+        with open(os.path.join(self.path, INFO_FILE), "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.dim = int(self.info["dim"])
+        self.count = int(self.info["count"])
+
+        self.meta = np.load(os.path.join(self.path, META_FILE), mmap_mode="r")
+        # 與 Chroma 後端相同，以逗號分隔字串表示
+        self.pages = {
+            cid: ",".join(map(str, pages))
+            for cid, pages in load_pages_sidecar(self.path).items()
+        }
+        self.vectors: Optional[np.ndarray] = None
+        self.compact: Optional[np.ndarray] = None
+        self.compact_scales: Optional[np.ndarray] = None
+        if not self.count:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._texts = np.zeros(0, dtype=np.uint8)
+            return
+
+        self._texts = np.memmap(
+            os.path.join(self.path, TEXTS_FILE), dtype=np.uint8, mode="r"
+        )
+        if self.info.get("has_float32", True):
+            self.vectors = np.memmap(
+                os.path.join(self.path, VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(self.count, self.dim),
+            )
+        compact = self.info.get("compact")
+        if compact:
+            shape = (self.count, int(compact["dim"]))
+            if compact["int8"]:
+                self.compact = np.memmap(
+                    os.path.join(self.path, COMPACT_I8_FILE),
+                    dtype=np.int8,
+                    mode="r",
+                    shape=shape,
+                )
+                self.compact_scales = np.memmap(
+                    os.path.join(self.path, COMPACT_SCALES_FILE),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(self.count,),
+                )
+            else:
+                self.compact = np.memmap(
+                    os.path.join(self.path, COMPACT_F32_FILE),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=shape,
+                )
+
+    def __len__(self):
+        return self.count
+
+    def get_text(self, i: int) -> str:
+        row = self.meta[i]
+        start = int(row["text_offset"])
+        return bytes(self._texts[start : start + int(row["text_len"])]).decode("utf-8")
+
+    def get_document(self, i: int) -> Document:
+        row = self.meta[i]
+        metadata = {"page": int(row["page"]), "chunk_id": str(int(row["chunk_id"]))}
+        if metadata["chunk_id"] in self.pages:
+            metadata["pages"] = self.pages[metadata["chunk_id"]]
+        return Document(page_content=self.get_text(i), metadata=metadata)
+
+    def full_precision_rows(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        """取回指定文本塊的 float32 向量；未保留 float32 時改用 embedding_function 重新計算。"""
+        if self.vectors is not None:
+            return np.asarray(self.vectors[ids])
+        if self.embedding_function is None:
+            return None
+        texts = [self.get_text(int(i)) for i in ids]
+        return normalize_rows(self.embedding_function.embed_documents(texts))
+
+    def search_by_vectors(
+        self, queries: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """一次矩陣乘法算出所有查詢的 cosine，回傳 (ids, 相似度)，形狀皆為 (n_queries, k)。
+
+        有精簡表示時先以精簡向量取 k * rescore_multiplier 個候選，再以全精度重新計分。
+        """
+        q = normalize_rows(np.atleast_2d(queries))
+        if not self.count:
+            # 沒有文本塊的報告書寫入時不知道維度（dim=0），不能做矩陣乘法
+            empty = np.zeros((len(q), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if self.compact is None:
+            return top_k(q @ self.vectors.T, k)
+
+        pool = k * max(self.rescore_multiplier, 1)
+        ids, sims = top_k(compact_scores(q, self.compact, self.compact_scales), pool)
+        if ids.shape[1] == 0:
+            return ids, sims
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        full = self.full_precision_rows(unique_ids)
+        if full is None:
+            return ids[:, :k], sims[:, :k]
+        rescored = np.take_along_axis(
+            q @ full.T, inverse.reshape(ids.shape), axis=1
+        )
+        order, best = top_k(rescored, k)
+        return np.take_along_axis(ids, order, axis=1), best
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        ids, sims = self.search_by_vectors(np.asarray(embedding), k)
+        # 與 Chroma 的 cosine space 相同，回傳距離 = 1 - cosine
+        return [
+            (self.get_document(int(i)), float(1.0 - s)) for i, s in zip(ids[0], sims[0])
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        if self.embedding_function is None:
+            raise ValueError("MatrixIndex 需要 embedding_function 才能以文字查詢")
+        vec = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(vec, k=k)
@@ -0,0 +1,145 @@
+import os
+import re
+from typing import List, Optional
+
+import numpy as np
+import onnxruntime as ort
+from langchain_core.embeddings import Embeddings
+from transformers import AutoTokenizer
+
+# ===== 可調參數 =====
+ONNX_MODEL_DIR = "onnx_models"
+ONNX_OPSET = 17
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_LENGTH = 8192
+
+
+def onnx_paths(model_name: str, model_dir: str = ONNX_MODEL_DIR):
+    safe_name = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+    base = os.path.join(model_dir, safe_name)
+    return base, os.path.join(base, "model.onnx"), os.path.join(base, "model.int8.onnx")
+
+
+def export_onnx(model_name: str, out_path: str):
+    """把 HuggingFace 模型匯出為輸出 last_hidden_state 的 ONNX（大於 2GB 時權重存成 external data）。"""
+    import torch
+    from transformers import AutoModel
+
+    print(f"[INFO] 匯出 ONNX：{model_name} → {out_path}")
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # Qwen3 等 decoder 預設 use_cache=True，追蹤時會回傳 DynamicCache，torch.onnx.export 無法處理
+    model = AutoModel.from_pretrained(model_name, torch_dtype=torch.float32, use_cache=False)
+    model.config.use_cache = False
+    model.eval()
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            out = self.inner(
+                input_ids=input_ids, attention_mask=attention_mask, use_cache=False
+            )
+            return out.last_hidden_state
+
+    dummy = tokenizer(["氣候相關財務揭露", "董事會監督"], padding=True, return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(model),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            out_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+
+
+def quantize_onnx(fp32_path: str, int8_path: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    print(f"[INFO] 動態量化為 int8：{int8_path}")
+    quantize_dynamic(
+        fp32_path,
+        int8_path,
+        weight_type=QuantType.QInt8,
+        use_external_data_format=True,
+    )
+
+
+def last_token_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    # 與 Qwen3-Embedding 的 sentence-transformers 設定相同：取最後一個非 padding token
+    if attention_mask[:, -1].all():
+        return hidden[:, -1]
+    lengths = attention_mask.sum(axis=1) - 1
+    return hidden[np.arange(hidden.shape[0]), lengths]
+
+
+class OnnxEmbeddings(Embeddings):
+    """在 ONNX Runtime 上執行 Qwen3-Embedding，可選 int8 動態量化，介面同 LangChain Embeddings。"""
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        num_threads: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        model_dir: str = ONNX_MODEL_DIR,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        _, fp32_path, int8_path = onnx_paths(model_name, model_dir)
+        if not os.path.exists(fp32_path):
+            export_onnx(model_name, fp32_path)
+        path = fp32_path
+        if quantize:
+            if not os.path.exists(int8_path):
+                quantize_onnx(fp32_path, int8_path)
+            path = int8_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        print(f"[INFO] ONNX Runtime 載入 {path}（threads={num_threads or 'auto'}）")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(
+                texts[i : i + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            inputs = {
+                "input_ids": batch["input_ids"].astype(np.int64),
+                "attention_mask": batch["attention_mask"].astype(np.int64),
+            }
+            hidden = self.session.run(["last_hidden_state"], inputs)[0]
+            pooled = last_token_pool(hidden, inputs["attention_mask"])
+            out.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(out).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
@@ -0,0 +1,131 @@
+import os
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+from onnx_embeddings import ONNX_MODEL_DIR, ONNX_OPSET, onnx_paths, quantize_onnx
+
+# ===== 可調參數 =====
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_LENGTH = 512
+
+
+def export_cross_encoder(model_name: str, out_path: str):
+    """把序列分類（cross-encoder）模型匯出為輸出 logits 的 ONNX。"""
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    print(f"[INFO] 匯出 ONNX：{model_name} → {out_path}")
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_name, torch_dtype=torch.float32
+    )
+    model.eval()
+    dummy = tokenizer(
+        ["氣候相關財務揭露", "董事會監督"],
+        ["本公司董事會每年檢視氣候風險", "永續委員會每季開會"],
+        padding=True,
+        return_tensors="pt",
+    )
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            out_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "logits": {0: "batch"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class OnnxReranker:
+    """在 ONNX Runtime 上執行 bge-reranker 類的 cross-encoder，compute_score 介面同 FlagReranker。"""
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        intra_threads: Optional[int] = None,
+        inter_threads: int = 1,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        model_dir: str = ONNX_MODEL_DIR,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        _, fp32_path, int8_path = onnx_paths(model_name, model_dir)
+        if not os.path.exists(fp32_path):
+            export_cross_encoder(model_name, fp32_path)
+        path = fp32_path
+        if quantize:
+            if not os.path.exists(int8_path):
+                quantize_onnx(fp32_path, int8_path)
+            path = int8_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_threads:
+            options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        print(
+            f"[INFO] ONNX Runtime 載入 reranker {path}"
+            f"（intra={intra_threads or 'auto'}, inter={inter_threads}）"
+        )
+
+    def _logits(self, pairs: List[Sequence[str]], batch_size: int, max_length: int):
+        out = []
+        for i in range(0, len(pairs), batch_size):
+            part = pairs[i : i + batch_size]
+            batch = self.tokenizer(
+                [str(q) for q, _ in part],
+                [str(p) for _, p in part],
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="np",
+            )
+            inputs = {
+                "input_ids": batch["input_ids"].astype(np.int64),
+                "attention_mask": batch["attention_mask"].astype(np.int64),
+            }
+            out.append(self.session.run(["logits"], inputs)[0].reshape(-1))
+        if not out:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(out).astype(np.float32)
+
+    def compute_score(
+        self,
+        sentence_pairs,
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None,
+        normalize: bool = False,
+    ) -> Union[float, List[float]]:
+        # 與 FlagReranker 相同：單一配對回傳純量，normalize=True 時取 sigmoid
+        single = len(sentence_pairs) == 2 and isinstance(sentence_pairs[0], str)
+        pairs = [sentence_pairs] if single else list(sentence_pairs)
+        scores = self._logits(
+            pairs, batch_size or self.batch_size, max_length or self.max_length
+        )
+        if normalize:
+            scores = sigmoid(scores)
+        scores = scores.tolist()
+        return scores[0] if len(scores) == 1 else scores
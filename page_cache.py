@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+
+# ===== 可調參數 =====
+# 以 PDF 內容雜湊為檔名快取 PyMuPDF 抽出的頁面文字，調整切塊參數時不必重新解析 PDF
+PAGE_CACHE_DIR = "page_text_cache"
+# 每個 row group 的頁數；讀取時逐 row group 串流，記憶體用量與總頁數無關
+ROW_GROUP_PAGES = 32
+
+SCHEMA = pa.schema(
+    [
+        ("page", pa.int32()),
+        ("text", pa.string()),
+        ("metadata", pa.string()),
+    ]
+)
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path(sha256: str, cache_dir: str = PAGE_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{sha256}.parquet")
+
+
+def _to_batch(pages) -> pa.RecordBatch:
+    return pa.RecordBatch.from_pydict(
+        {
+            "page": [int(p.metadata.get("page", -1)) for p in pages],
+            "text": [p.page_content for p in pages],
+            "metadata": [
+                json.dumps(p.metadata, ensure_ascii=False, default=str) for p in pages
+            ],
+        },
+        schema=SCHEMA,
+    )
+
+
+def extract_pages(pdf_path: str, path: str) -> Iterator[Document]:
+    """用 PyMuPDF 逐頁解析，邊產生頁面邊寫入快取；完整跑完才換上正式檔名。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer = pq.ParquetWriter(tmp_path, SCHEMA, compression="zstd")
+    window = []
+    try:
+        for page in PyMuPDFLoader(pdf_path).lazy_load():
+            window.append(page)
+            yield page
+            if len(window) >= ROW_GROUP_PAGES:
+                writer.write_batch(_to_batch(window))
+                window = []
+        if window:
+            writer.write_batch(_to_batch(window))
+        writer.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            writer.close()
+            os.remove(tmp_path)
+
+
+def read_pages(pf: pq.ParquetFile) -> Iterator[Document]:
+    for batch in pf.iter_batches(batch_size=ROW_GROUP_PAGES):
+        cols = batch.to_pydict()
+        for text, meta in zip(cols["text"], cols["metadata"]):
+            yield Document(page_content=text, metadata=json.loads(meta))
+
+
+def iter_cached_pages(
+    pdf_path: str, cache_dir: str = PAGE_CACHE_DIR, sha256: Optional[str] = None
+) -> Iterator[Document]:
+    """依序產生 PDF 每一頁的 Document，metadata 與 PyMuPDFLoader 相同（page 從 0 開始）。
+
+    呼叫端已算過內容雜湊（例如建庫指紋）時傳入 sha256，避免再讀一次整份 PDF。
+    """
+    path = cache_path(sha256 or file_sha256(pdf_path), cache_dir)
+    if os.path.exists(path):
+        try:
+            pf = pq.ParquetFile(path)
+        except (OSError, pa.ArrowException) as e:
+            print(f"[WARN] 頁面快取損毀，重新解析 {pdf_path}：{e}")
+            os.remove(path)
+        else:
+            yield from read_pages(pf)
+            return
+    yield from extract_pages(pdf_path, path)
@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chunk_dedup import load_pages_sidecar
+from matrix_index import normalize_rows, top_k
+
+# ===== 可調參數 =====
+# 頁面向量 = 該頁所有文本塊向量的平均（再正規化），建庫時順便算，不需額外 embed
+# 去重合併過的文本塊（metadata "pages"）會計入它出現過的每一頁；
+# 串流建庫時文本塊寫入後才發現的重複頁只記在 dedup_pages.json，不計入頁面向量，但檢索篩選仍會納入
+PAGE_INDEX_DIR = "page_index"
+PAGE_VECTORS_FILE = "pages.f32"
+PAGE_INFO_FILE = "pages.json"
+
+
+def page_index_path(store_path: str) -> str:
+    return os.path.join(store_path, PAGE_INDEX_DIR)
+
+
+class PageIndexBuilder:
+    """建庫時逐批累加每頁的文本塊向量，save() 時寫出頁面層級的向量。"""
+
+    def __init__(self):
+        self._sums: Dict[int, np.ndarray] = {}
+        self._counts: Dict[int, int] = {}
+
+    def add(self, documents, vectors):
+        if not documents:
+            return
+        mat = normalize_rows(vectors)
+        for doc, vec in zip(documents, mat):
+            page = int(doc.metadata.get("page", -1))
+            # chunks_per_page 只數主要頁碼，作為依 page 篩選時的文本塊數上限
+            self._counts[page] = self._counts.get(page, 0) + 1
+            merged = doc.metadata.get("pages")
+            for p in {page, *(int(x) for x in merged.split(","))} if merged else (page,):
+                if p in self._sums:
+                    self._sums[p] += vec
+                else:
+                    self._sums[p] = vec.copy()
+
+    def save(self, store_path: str):
+        path = page_index_path(store_path)
+        tmp = f"{path}.tmp"
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        pages = sorted(self._sums)
+        mat = (
+            normalize_rows(np.stack([self._sums[p] for p in pages]))
+            if pages
+            else np.zeros((0, 0), dtype=np.float32)
+        )
+        with open(os.path.join(tmp, PAGE_VECTORS_FILE), "wb") as f:
+            f.write(np.ascontiguousarray(mat, dtype=np.float32).tobytes())
+        info = {
+            "dim": int(mat.shape[1]) if pages else 0,
+            "pages": pages,
+            "chunks_per_page": [self._counts.get(p, 0) for p in pages],
+        }
+        with open(os.path.join(tmp, PAGE_INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+
+class PageIndex:
+    def __init__(self, store_path: str):
+        path = page_index_path(store_path)
+        with open(os.path.join(path, PAGE_INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.pages = np.asarray(info["pages"], dtype=np.int64)
+        self.chunks_per_page = np.asarray(info["chunks_per_page"], dtype=np.int64)
+        # chunk_id -> 去重合併的所有頁碼（第一次出現的頁即最小頁碼，也就是 metadata "page"）
+        self.merged_pages = load_pages_sidecar(store_path)
+        dim = int(info["dim"])
+        self.vectors = (
+            np.memmap(
+                os.path.join(path, PAGE_VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self.pages), dim),
+            )
+            if len(self.pages)
+            else np.zeros((0, dim), dtype=np.float32)
+        )
+
+    @staticmethod
+    def exists(store_path: str) -> bool:
+        return os.path.exists(os.path.join(page_index_path(store_path), PAGE_INFO_FILE))
+
+    def search(self, queries: np.ndarray, top_pages: int) -> List[List[int]]:
+        """回傳每條查詢最相似的 top_pages 個頁碼。"""
+        q = normalize_rows(np.atleast_2d(queries))
+        ids, _ = top_k(q @ np.asarray(self.vectors).T, top_pages)
+        return [[int(self.pages[i]) for i in row] for row in ids]
+
+    def chunk_count(self, pages: List[int]) -> int:
+        return int(self.chunks_per_page[np.isin(self.pages, pages)].sum())
+
+    def merged_chunks(self, pages: List[int]) -> List[str]:
+        """主要頁碼不在 pages、但因去重合併而也出現在 pages 上的文本塊 chunk_id。"""
+        wanted = set(int(p) for p in pages)
+        return [
+            cid
+            for cid, merged in self.merged_pages.items()
+            if min(merged) not in wanted and wanted.intersection(merged)
+        ]
+
+
+def load_page_index(store_path: str) -> Optional[PageIndex]:
+    return PageIndex(store_path) if PageIndex.exists(store_path) else None
@@ -1,14 +1,88 @@
 import os
+import json
+import time
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from tqdm.auto import tqdm
 
 # from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from FlagEmbedding import FlagReranker
+from embedding_backends import build_embeddings, log_embedding_stats
+from matrix_index import MatrixIndex
+from batch_retrieval import search_batch, hybrid_search_batch, hierarchical_search_batch
+from lexical_index import load_lexical_index
+from page_index import load_page_index
+from rerank_batching import BulkReranker
+from score_cache import RerankScoreCache
+from cascade_rerank import CascadeReranker
+from result_store import write_guidelines, write_records
+from retrieval_client import RetrievalClient
 import torch
 
+# ===== 可調參數 =====
+GUIDELINES_PATH = "data/tcfd第四層揭露指引.xlsx"
+# "chroma" 或 "matrix"（memmap 精確檢索），需與 create_all_db.py 建庫時的設定一致
+INDEX_BACKEND = "chroma"
+BASE_CHROMA_PATH = (
+    "matrix_report_TCFD" if INDEX_BACKEND == "matrix" else "chroma_report_TCFD"
+)
+OUTPUT_DIR = "data/TCFD_report_improved_query_result"
+
+CANDIDATE_K = 50
+TOP_N = 5
+# "dense"：只用向量前 CANDIDATE_K；"hybrid"：向量與 BM25 字元 n-gram 以 RRF 融合後取 HYBRID_CANDIDATE_K
+# （需以 BUILD_LEXICAL_INDEX=True 建庫；缺少 bm25/ 的報告書自動退回 dense）；
+# "hierarchical"：先以頁面向量選 HIER_TOP_PAGES 頁，再只在這些頁裡取 HIER_CANDIDATE_K 個文本塊
+# （需以 BUILD_PAGE_INDEX=True 建庫；缺少 page_index/ 的報告書自動退回 dense）
+RETRIEVAL_MODE = "dense"
+HYBRID_CANDIDATE_K = 20
+HYBRID_DENSE_K = 50
+HYBRID_LEXICAL_K = 50
+RRF_K = 60
+HIER_TOP_PAGES = 20
+HIER_CANDIDATE_K = 30
+EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+RERANKER_MODEL_NAME = "BAAI/bge-reranker-v2-m3"
+# "torch" | "onnx" | "onnx-int8"，需與建庫時相同
+EMBEDDING_BACKEND = "torch"
+ONNX_THREADS = None
+# 與 create_all_db.py 共用同一份 embedding 快取
+USE_EMBEDDING_CACHE = True
+EMBEDDING_CACHE_DIR = "embedding_cache"
+# 每累積幾家公司就把所有 (Definition, chunk) 配對一起 rerank；相同配對只算一次
+# "torch"：FlagReranker；"onnx" / "onnx-int8"：ONNX Runtime（CPU 節點建議 onnx-int8）
+RERANKER_BACKEND = "torch"
+RERANKER_ONNX_INTRA_THREADS = None
+RERANKER_ONNX_INTER_THREADS = 1
+RERANK_GROUP_SIZE = 4
+RERANK_TOKEN_BUDGET = 32768
+# 以 (模型, Definition 雜湊, chunk 雜湊) 快取 rerank 分數，重跑時只算新配對
+USE_RERANK_CACHE = True
+RERANK_CACHE_PATH = "rerank_score_cache.sqlite"
+RERANK_CACHE_MAX_ENTRIES = 2_000_000
+# 兩階段 rerank：先以 cosine + 字元 n-gram 覆蓋率剪到 CASCADE_KEEP_M 個，只有這些送進 cross-encoder；
+# 抽樣 CASCADE_AUDIT_RATE 比例的 (公司, 指引) 另跑完整 rerank，統計 TOP_N 與單階段不同的比例
+USE_CASCADE_RERANK = False
+CASCADE_KEEP_M = 15
+CASCADE_AUDIT_RATE = 0.05
+# >0 時改用分片模式：每家公司為一個工作，分給 RETRIEVAL_WORKERS 個行程（各自載入模型）；
+# 每 CHECKPOINT_EVERY 條指引寫一次 {輸出檔}.partial.jsonl，中斷後從該檔續跑，
+# 全部完成後才以原子 rename 換成正式輸出檔
+RETRIEVAL_WORKERS = 0
+# 預設每條指引都寫檢查點，中斷最多重做一條；調大可讓 rerank 一次湊更多指引，但中斷時重做較多
+CHECKPOINT_EVERY = 1
+# "csv"：與原本相同的寬表；"parquet"：指引與文本塊只存一次在 OUTPUT_DIR/_dims，
+# 每家公司輸出 {公司}_output_chunks.parquet 事實表（以 result_store.load_results 讀回寬表）
+OUTPUT_FORMAT = "csv"
+# 精簡用戶端模式：不在本行程載入模型，改把每 RERANK_GROUP_SIZE 家公司送到常駐的 retrieval_server.py
+USE_RETRIEVAL_SERVER = False
+RETRIEVAL_SERVER_URL = "http://127.0.0.1:8765"
+
 
 def load_guidelines(excel_path: str, sheet_name: str = "工作表2"):
     df = pd.read_excel(excel_path, sheet_name=sheet_name)
@@ -24,21 +98,425 @@ def get_chroma_dirs(base_chroma_path: str):
     if os.path.exists(base_chroma_path):
         for item in os.listdir(base_chroma_path):
             full_path = os.path.join(base_chroma_path, item)
-            if os.path.isdir(full_path):
+            if os.path.isdir(full_path) and not item.endswith(".tmp"):
                 chroma_dirs.append(full_path)
     return sorted(chroma_dirs)
 
 
-def main():
+def build_cross_encoder(device: str):
+    if RERANKER_BACKEND == "torch":
+        return FlagReranker(RERANKER_MODEL_NAME, use_fp16=True, device=device)
+    from onnx_reranker import OnnxReranker
+
+    return OnnxReranker(
+        RERANKER_MODEL_NAME,
+        quantize=RERANKER_BACKEND == "onnx-int8",
+        intra_threads=RERANKER_ONNX_INTRA_THREADS,
+        inter_threads=RERANKER_ONNX_INTER_THREADS,
+    )
+
+
+def reranker_cache_id() -> str:
+    # 不同 backend 的分數有些微差異，快取鍵需分開
+    if RERANKER_BACKEND == "torch":
+        return RERANKER_MODEL_NAME
+    return f"{RERANKER_MODEL_NAME}@{RERANKER_BACKEND}"
+
+
+def load_models(device: str):
+    """每個行程只載入一次 embedding 模型與 reranker，回傳 (embeddings, reranker, 載入秒數)。"""
+    t0 = time.perf_counter()
+    embeddings = build_embeddings(
+        EMBEDDING_MODEL_NAME,
+        backend=EMBEDDING_BACKEND,
+        device=device,
+        onnx_threads=ONNX_THREADS,
+        use_cache=USE_EMBEDDING_CACHE,
+        cache_dir=EMBEDDING_CACHE_DIR,
+    )
+    reranker = BulkReranker(
+        build_cross_encoder(device),
+        RERANKER_MODEL_NAME,
+        token_budget=RERANK_TOKEN_BUDGET,
+        cache=(
+            RerankScoreCache(
+                reranker_cache_id(),
+                path=RERANK_CACHE_PATH,
+                max_entries=RERANK_CACHE_MAX_ENTRIES,
+            )
+            if USE_RERANK_CACHE
+            else None
+        ),
+    )
+    return embeddings, reranker, time.perf_counter() - t0
+
+
+def embed_guidelines(embeddings, guidelines) -> np.ndarray:
+    """整份指引的 Definition 一次 embed 成矩陣，(n_guidelines, dim)，所有公司共用。"""
+    definitions = [str(g["Definition"]) for g in guidelines]
+    unique = list(dict.fromkeys(definitions))
+    vectors = dict(zip(unique, embeddings.embed_documents(unique)))
+    return np.asarray([vectors[d] for d in definitions], dtype=np.float32)
+
+
+def output_path(company_name: str) -> str:
+    return os.path.join(OUTPUT_DIR, f"{company_name}_output_chunks.{OUTPUT_FORMAT}")
+
+
+def write_output(output_filename: str, company_name: str, output_records):
+    """先寫暫存檔再 os.replace，輸出檔存在即代表該公司已完整處理。"""
+    if OUTPUT_FORMAT == "parquet":
+        write_records(output_records, output_filename, company_name, OUTPUT_DIR)
+        return
+    tmp_path = f"{output_filename}.tmp"
+    pd.DataFrame(output_records).to_csv(tmp_path, index=False, encoding="utf-8-sig")
+    os.replace(tmp_path, output_filename)
+
+
+def open_report_store(chroma_dir: str, embeddings):
+    if INDEX_BACKEND == "matrix":
+        return MatrixIndex(persist_directory=chroma_dir, embedding_function=embeddings)
+    return Chroma(persist_directory=chroma_dir, embedding_function=embeddings)
+
+
+def retrieve_candidates(
+    db, chroma_dir: str, guidelines, guideline_vectors, candidate_k=None, mode=None
+):
+    mode = mode or RETRIEVAL_MODE
+    if mode == "hierarchical":
+        page_index = load_page_index(chroma_dir)
+        if page_index is not None:
+            return hierarchical_search_batch(
+                db,
+                page_index,
+                guideline_vectors,
+                k=candidate_k or HIER_CANDIDATE_K,
+                top_pages=HIER_TOP_PAGES,
+            )
+        print(f"[WARN] {chroma_dir} 沒有頁面索引，改用純向量檢索。")
+    if mode == "hybrid":
+        lexical = load_lexical_index(chroma_dir)
+        if lexical is not None:
+            return hybrid_search_batch(
+                db,
+                lexical,
+                guideline_vectors,
+                [str(g["Definition"]) for g in guidelines],
+                k=candidate_k or HYBRID_CANDIDATE_K,
+                dense_k=HYBRID_DENSE_K,
+                lexical_k=HYBRID_LEXICAL_K,
+                rrf_k=RRF_K,
+            )
+        print(f"[WARN] {chroma_dir} 沒有 BM25 索引，改用純向量檢索。")
+    return search_batch(db, guideline_vectors, candidate_k or CANDIDATE_K)
+
+
+class CompanyJob:
+    """一家公司的檢索結果，等同組公司一起 rerank 後再輸出。"""
+
+    def __init__(self, company_name: str, output_filename: str, batch, retrieve_sec: float):
+        self.company_name = company_name
+        self.output_filename = output_filename
+        self.batch = batch
+        self.retrieve_sec = retrieve_sec
+
+
+def build_output_records(
+    company_name: str, guidelines, batch, scores_by_row, rows=None, top_n: int = TOP_N
+):
+    output_records = []
+    for gi in range(len(guidelines)) if rows is None else rows:
+        item = guidelines[gi]
+        label, definition, point = item["Label"], item["Definition"], item["Point"]
+        rough = batch.candidates(gi)
+        if not rough:
+            continue
+
+        reranked = sorted(
+            zip(rough, scores_by_row[gi]), key=lambda x: x[1], reverse=True
+        )[:top_n]
+
+        for rank, ((doc, dist), sim) in enumerate(reranked, start=1):
+            output_records.append(
+                {
+                    "Company": company_name,
+                    "Label": label,
+                    "Definition": definition,
+                    "Point": point,
+                    "報告書頁數": doc.metadata.get("page", "N/A"),
+                    "Chunk ID": doc.metadata.get("chunk_id", "N/A"),
+                    "Chunk Text": doc.page_content.replace("\n", " "),
+                    "是否真的有揭露此標準?(Y/N)": "",
+                    "reasoning": "",
+                    "RerankScore": float(sim),
+                    "InitScoreOrDist": float(dist),
+                    "Rank": rank,
+                }
+            )
+    return output_records
+
+
+def rerank_group(jobs, guidelines, reranker, cascade=None, rows=None):
+    """整組公司的候選一起 rerank，回傳每家公司的 scores_by_row 與分攤的 rerank 秒數。
+
+    使用 cascade 時被第一階段剪掉的候選分數為 -inf，不會進入 TOP_N。
+    rows 指定只處理哪些指引（索引），預設全部。
+    """
+    pairs, owners, audits = [], [], []
+    per_job = [[[] for _ in guidelines] for _ in jobs]
+    for ji, job in enumerate(jobs):
+        for gi in range(len(guidelines)) if rows is None else rows:
+            item = guidelines[gi]
+            rough = job.batch.candidates(gi)
+            per_job[ji][gi] = [float("-inf")] * len(rough)
+            cols = range(len(rough))
+            if cascade is not None:
+                kept = cascade.select(item["Definition"], rough)
+                if len(kept) < len(rough) and cascade.should_audit():
+                    audits.append((ji, gi, kept))
+                else:
+                    cols = kept
+            for col in cols:
+                pairs.append((item["Definition"], rough[col][0].page_content))
+                owners.append((ji, gi, col))
+
+    t0 = time.perf_counter()
+    scores = reranker.score(pairs)
+    rerank_sec = time.perf_counter() - t0
+
+    pair_counts = [0] * len(jobs)
+    for (ji, gi, col), score in zip(owners, scores):
+        per_job[ji][gi][col] = score
+        pair_counts[ji] += 1
+    for ji, gi, kept in audits:
+        full = per_job[ji][gi]
+        cascade.record_audit(full, kept)
+        # 輸出仍採 cascade 的結果，不因抽樣與否而不同
+        keep = set(kept)
+        per_job[ji][gi] = [s if c in keep else float("-inf") for c, s in enumerate(full)]
+    shares = [
+        rerank_sec * c / len(pairs) if pairs else 0.0 for c in pair_counts
+    ]
+    return per_job, shares
+
+
+def flush_jobs(jobs, guidelines, reranker, company_seconds: dict, cascade=None):
+    if not jobs:
+        return
+    print(f"[INFO] 一起 rerank {len(jobs)} 家公司的候選…")
+    per_job, shares = rerank_group(jobs, guidelines, reranker, cascade)
+    for job, scores_by_row, share in zip(jobs, per_job, shares):
+        output_records = build_output_records(
+            job.company_name, guidelines, job.batch, scores_by_row
+        )
+        write_output(job.output_filename, job.company_name, output_records)
+        print(f"\n{OUTPUT_FORMAT.upper()} 已輸出：{job.output_filename}")
+        company_seconds[job.company_name] = job.retrieve_sec + share
+        print(
+            f"[INFO] {job.company_name} 耗時 {company_seconds[job.company_name]:.1f}s"
+            f"（檢索 {job.retrieve_sec:.1f}s + rerank 分攤 {share:.1f}s）"
+        )
+        print(f"--- 完成處理 {job.company_name} 的 ChromaDB ---\n")
+
+
+def checkpoint_path(output_filename: str) -> str:
+    return f"{output_filename}.partial.jsonl"
+
+
+def load_checkpoint(path: str, guidelines) -> dict:
+    """讀回已完成的指引：{指引索引: 輸出列}。Label 對不上或最後一行寫到一半的紀錄都略過。"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            gi = entry.get("gi")
+            if isinstance(gi, int) and gi < len(guidelines) and (
+                str(guidelines[gi]["Label"]) == entry.get("label")
+            ):
+                done[gi] = entry["records"]
+    return done
+
+
+def _checkpoint_line(gi: int, guidelines, records) -> str:
+    entry = {"gi": gi, "label": str(guidelines[gi]["Label"]), "records": records}
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+def finalize_company(output_filename: str, company_name: str, guidelines, done: dict):
+    records = [r for gi in range(len(guidelines)) for r in done.get(gi, [])]
+    write_output(output_filename, company_name, records)
+    if os.path.exists(checkpoint_path(output_filename)):
+        os.remove(checkpoint_path(output_filename))
+
+
+_WORKER = {}
+
+
+def _init_worker(progress_queue, torch_threads: int):
+    """每個 worker 行程載入一次模型並 embed 指引。"""
     load_dotenv()
-    GUIDELINES_PATH = "data/tcfd第四層揭露指引.xlsx"
-    BASE_CHROMA_PATH = "chroma_report_TCFD"
-    OUTPUT_DIR = "data/TCFD_report_improved_query_result"
+    torch.set_num_threads(torch_threads)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    embeddings, reranker, _ = load_models(device)
+    guidelines = load_guidelines(GUIDELINES_PATH)
+    _WORKER.update(
+        progress=progress_queue,
+        embeddings=embeddings,
+        reranker=reranker,
+        guidelines=guidelines,
+        vectors=embed_guidelines(embeddings, guidelines),
+        cascade=(
+            CascadeReranker(CASCADE_KEEP_M, top_n=TOP_N, audit_rate=CASCADE_AUDIT_RATE)
+            if USE_CASCADE_RERANK
+            else None
+        ),
+    )
+
+
+def run_company_resumable(chroma_dir: str):
+    """處理一家公司，每 CHECKPOINT_EVERY 條指引追加一次檢查點；回傳 (公司, 耗時秒數, 續跑的指引數)。"""
+    w = _WORKER
+    guidelines = w["guidelines"]
+    company_name = os.path.basename(chroma_dir)
+    output_filename = output_path(company_name)
+    ckpt = checkpoint_path(output_filename)
+    done = load_checkpoint(ckpt, guidelines)
+    resumed = len(done)
+
+    t0 = time.perf_counter()
+    todo = [gi for gi in range(len(guidelines)) if gi not in done]
+    if todo:
+        db = open_report_store(chroma_dir, w["embeddings"])
+        batch = retrieve_candidates(db, chroma_dir, guidelines, w["vectors"])
+        job = CompanyJob(company_name, output_filename, batch, 0.0)
+        # 重寫檢查點，丟掉可能寫到一半的最後一行
+        with open(f"{ckpt}.tmp", "w", encoding="utf-8") as f:
+            for gi in sorted(done):
+                f.write(_checkpoint_line(gi, guidelines, done[gi]))
+        os.replace(f"{ckpt}.tmp", ckpt)
+
+        with open(ckpt, "a", encoding="utf-8") as f:
+            for start in range(0, len(todo), CHECKPOINT_EVERY):
+                rows = todo[start : start + CHECKPOINT_EVERY]
+                per_job, _ = rerank_group([job], guidelines, w["reranker"], w["cascade"], rows)
+                for gi in rows:
+                    records = build_output_records(
+                        company_name, guidelines, batch, per_job[0], rows=[gi]
+                    )
+                    done[gi] = records
+                    f.write(_checkpoint_line(gi, guidelines, records))
+                f.flush()
+                os.fsync(f.fileno())
+                w["progress"].put(("guidelines", len(rows)))
+
+    finalize_company(output_filename, company_name, guidelines, done)
+    w["progress"].put(("company", company_name))
+    return company_name, time.perf_counter() - t0, resumed
+
+
+def run_sharded(chroma_paths, guidelines):
+    todo, resumed = [], 0
+    for chroma_dir in chroma_paths:
+        company_name = os.path.basename(chroma_dir)
+        output_filename = output_path(company_name)
+        if os.path.exists(output_filename):
+            continue
+        todo.append(chroma_dir)
+        resumed += len(load_checkpoint(checkpoint_path(output_filename), guidelines))
+    print(
+        f"[INFO] 分片模式：{len(todo)} 家公司待處理（跳過 {len(chroma_paths) - len(todo)} 家已完成），"
+        f"{RETRIEVAL_WORKERS} 個 worker；檢查點已完成 {resumed} 條指引"
+    )
+    if not todo:
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    manager = ctx.Manager()
+    progress_queue = manager.Queue()
+    torch_threads = max(1, (os.cpu_count() or 1) // RETRIEVAL_WORKERS)
+    bar = tqdm(
+        total=len(todo) * len(guidelines),
+        initial=resumed,
+        desc="指引進度（所有 worker）",
+        unit="條",
+    )
+    companies_done = 0
+    start = time.perf_counter()
+
+    def drain():
+        nonlocal companies_done
+        while True:
+            try:
+                kind, value = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "guidelines":
+                bar.update(value)
+            else:
+                companies_done += 1
+                bar.set_postfix_str(f"公司 {companies_done}/{len(todo)}")
 
-    CANDIDATE_K = 50
-    TOP_N = 5
-    EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+    with ProcessPoolExecutor(
+        max_workers=RETRIEVAL_WORKERS,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(progress_queue, torch_threads),
+    ) as pool:
+        futures = {pool.submit(run_company_resumable, d): d for d in todo}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            drain()
+            for fut in finished:
+                try:
+                    company_name, seconds, from_ckpt = fut.result()
+                    note = f"，由檢查點續跑 {from_ckpt} 條指引" if from_ckpt else ""
+                    tqdm.write(f"[SUCCESS] {company_name} 完成，耗時 {seconds:.1f}s{note}")
+                except Exception as e:
+                    tqdm.write(f"[ERROR] {os.path.basename(futures[fut])} 失敗（檢查點保留）：{e}")
+    drain()
+    bar.close()
+    manager.shutdown()
+    elapsed = time.perf_counter() - start
+    print(
+        f"[INFO] 分片模式完成 {companies_done}/{len(todo)} 家公司，總耗時 {elapsed:.1f}s"
+        f"（含各 worker 模型載入）"
+    )
 
+
+def run_via_server(chroma_paths):
+    client = RetrievalClient(RETRIEVAL_SERVER_URL)
+    stats = client.stats()
+    print(
+        f"[INFO] 使用檢索服務 {RETRIEVAL_SERVER_URL}（{stats['index_backend']}，"
+        f"服務啟動耗時 {stats['startup']['total_s']:.1f}s，本行程不載入模型）"
+    )
+    todo = []
+    for chroma_dir in chroma_paths:
+        company_name = os.path.basename(chroma_dir)
+        output_filename = output_path(company_name)
+        if os.path.exists(output_filename):
+            print(f"[INFO] 檔案 '{output_filename}' 已存在，跳過處理 {company_name}。")
+            continue
+        todo.append(company_name)
+
+    for start in tqdm(range(0, len(todo), RERANK_GROUP_SIZE), desc="公司進度"):
+        group = todo[start : start + RERANK_GROUP_SIZE]
+        resp = client.query(group, candidate_k=None, top_n=TOP_N)
+        for company_name, records in resp["results"].items():
+            write_output(output_path(company_name), company_name, records)
+            print(f"\n{OUTPUT_FORMAT.upper()} 已輸出：{output_path(company_name)}")
+        timing = "，".join(f"{k} {v:.2f}s" for k, v in resp["timing"].items())
+        print(f"[INFO] {len(group)} 家公司：服務端 {timing}；來回 {resp['round_trip_s']:.2f}s")
+
+
+def main():
+    load_dotenv()
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"[INFO] Using device: {device}")
     print("CUDA 可用：", torch.cuda.is_available())
@@ -46,8 +524,31 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     guidelines = load_guidelines(GUIDELINES_PATH)
+    if OUTPUT_FORMAT == "parquet":
+        write_guidelines(OUTPUT_DIR, guidelines)
 
-    reranker = FlagReranker("BAAI/bge-reranker-v2-m3", use_fp16=True, device=device)
+    if USE_RETRIEVAL_SERVER:
+        run_via_server(get_chroma_dirs(BASE_CHROMA_PATH))
+        return
+
+    if RETRIEVAL_WORKERS > 0:
+        chroma_paths = get_chroma_dirs(BASE_CHROMA_PATH)
+        if not chroma_paths:
+            print(
+                f"[ERROR] 在 '{BASE_CHROMA_PATH}' 中沒有找到任何 ChromaDB 目錄。請確認建立 DB 已成功。"
+            )
+            return
+        run_sharded(chroma_paths, guidelines)
+        return
+
+    embeddings, reranker, load_sec = load_models(device)
+    print(f"[INFO] 模型載入耗時 {load_sec:.1f}s")
+
+    t0 = time.perf_counter()
+    guideline_vectors = embed_guidelines(embeddings, guidelines)
+    print(
+        f"[INFO] {len(guidelines)} 條指引 embedding 完成，耗時 {time.perf_counter() - t0:.1f}s"
+    )
 
     chroma_paths = get_chroma_dirs(BASE_CHROMA_PATH)
     if not chroma_paths:
@@ -58,67 +559,53 @@ def main():
 
     print(f"[INFO] 找到 {len(chroma_paths)} 個 ChromaDB 準備處理。")
 
-    for chroma_dir in chroma_paths:
+    cascade = (
+        CascadeReranker(CASCADE_KEEP_M, top_n=TOP_N, audit_rate=CASCADE_AUDIT_RATE)
+        if USE_CASCADE_RERANK
+        else None
+    )
+    company_seconds = {}
+    jobs = []
+    for chroma_dir in tqdm(chroma_paths, desc="公司進度"):
         company_name = os.path.basename(chroma_dir)
-        output_filename = os.path.join(OUTPUT_DIR, f"{company_name}_output_chunks.csv")
+        output_filename = output_path(company_name)
 
         if os.path.exists(output_filename):
             print(f"[INFO] 檔案 '{output_filename}' 已存在，跳過處理 {company_name}。")
             continue
 
         print(f"\n--- 開始處理 {company_name} 的 ChromaDB ---")
+        company_start = time.perf_counter()
 
-        embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            model_kwargs={"device": device},
-        )
-        # embeddings = OpenAIEmbeddings()
         try:
-            db = Chroma(persist_directory=chroma_dir, embedding_function=embeddings)
-            print(f"[INFO] 成功載入 {company_name} 的 ChromaDB。")
+            db = open_report_store(chroma_dir, embeddings)
+            print(f"[INFO] 成功載入 {company_name} 的 {INDEX_BACKEND} 向量庫。")
         except Exception as e:
             print(f"[ERROR] 載入 {company_name} 的 ChromaDB 失敗：{e}")
             continue
 
-        output_records = []
-
-        for item in tqdm(guidelines, desc=f"TCFD 指引進度 ({company_name})"):
-            label, definition, point = item["Label"], item["Definition"], item["Point"]
-
-            rough = db.similarity_search_with_score(definition, k=CANDIDATE_K)
-            if not rough:
-                continue
-
-            pairs = [[definition, doc.page_content] for doc, _ in rough]
-            scores = reranker.compute_score(pairs, normalize=True)
-
-            reranked = sorted(zip(rough, scores), key=lambda x: x[1], reverse=True)[
-                :TOP_N
-            ]
-
-            for rank, ((doc, dist), sim) in enumerate(reranked, start=1):
-                output_records.append(
-                    {
-                        "Company": company_name,
-                        "Label": label,
-                        "Definition": definition,
-                        "Point": point,
-                        "報告書頁數": doc.metadata.get("page", "N/A"),
-                        "Chunk ID": doc.metadata.get("chunk_id", "N/A"),
-                        "Chunk Text": doc.page_content.replace("\n", " "),
-                        "是否真的有揭露此標準?(Y/N)": "",
-                        "reasoning": "",
-                        "RerankScore": float(sim),
-                        "InitScoreOrDist": float(dist),
-                        "Rank": rank,
-                    }
-                )
-
-        out_df = pd.DataFrame(output_records)
-        out_df.to_csv(output_filename, index=False, encoding="utf-8-sig")
-        print(f"\nCSV 已輸出：{output_filename}")
-        print(f"--- 完成處理 {company_name} 的 ChromaDB ---\n")
+        batch = retrieve_candidates(db, chroma_dir, guidelines, guideline_vectors)
+        retrieve_sec = time.perf_counter() - company_start
+        levels = "".join(f"，{k} {v:.3f}s" for k, v in batch.timing.items())
+        print(f"[INFO] {len(guidelines)} 條指引批次檢索完成，耗時 {retrieve_sec:.2f}s{levels}")
+        jobs.append(CompanyJob(company_name, output_filename, batch, retrieve_sec))
+
+        if len(jobs) >= RERANK_GROUP_SIZE:
+            flush_jobs(jobs, guidelines, reranker, company_seconds, cascade)
+            jobs = []
+    flush_jobs(jobs, guidelines, reranker, company_seconds, cascade)
+
+    if company_seconds:
+        total = sum(company_seconds.values())
+        print(
+            f"[INFO] 共處理 {len(company_seconds)} 家公司，檢索+rerank 總耗時 {total:.1f}s，"
+            f"平均每家 {total / len(company_seconds):.1f}s；模型載入 {load_sec:.1f}s（僅一次）"
+        )
+    reranker.log_stats()
+    if cascade is not None:
+        cascade.log_stats()
+    log_embedding_stats(embeddings)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -5,6 +5,7 @@ from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from FlagEmbedding import FlagReranker
 from tqdm.auto import tqdm          # ★ 新增：進度條
+from retrieval_client import RetrievalClient
 
 # ------------ 輔助函式 ------------
 def load_guidelines(excel_path: str, sheet_name: str = '工作表2'):
@@ -23,9 +24,36 @@ def main():
 
     CANDIDATE_K = 50
     TOP_N       = 10
+    # ★ 精簡用戶端模式：改問常駐的 retrieval_server.py（模型已載入），
+    #   報告書以 CHROMA_DIR 的目錄名稱在服務端的向量庫中查找
+    USE_RETRIEVAL_SERVER = False
+    RETRIEVAL_SERVER_URL = 'http://127.0.0.1:8765'
 
     guidelines  = load_guidelines(GUIDELINES_PATH)
 
+    if USE_RETRIEVAL_SERVER:
+        company = os.path.basename(CHROMA_DIR)
+        resp = RetrievalClient(RETRIEVAL_SERVER_URL).query(
+            [company],
+            guidelines=[{'Label': str(g['Label']), 'Definition': str(g['Definition']),
+                         'Point': str(g.get('Point', ''))} for g in guidelines],
+            candidate_k=CANDIDATE_K, top_n=TOP_N)
+        output_records = [{
+            'Label'     : r['Label'],
+            'Definition': r['Definition'],
+            'Rank'      : r['Rank'],
+            'CosDist'   : r['InitScoreOrDist'],
+            'ReScore'   : r['RerankScore'],
+            'Page'      : r['報告書頁數'],
+            'Chunk ID'  : r['Chunk ID'],
+            'Content'   : r['Chunk Text'],
+        } for r in resp['results'][company]]
+        print(f"服務端耗時：{resp['timing']}，來回 {resp['round_trip_s']:.2f}s")
+        pd.DataFrame(output_records).to_csv('永豐金控2023_output_chunks.csv',
+                                            index=False, encoding='utf-8-sig')
+        print('\nCSV 已輸出：永豐金控2023_output_chunks.csv')
+        return
+
     # ▶︎ 初始化向量庫與 reranker
     embedding = OpenAIEmbeddings()
     db        = Chroma(persist_directory=CHROMA_DIR,
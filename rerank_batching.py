@@ -0,0 +1,100 @@
+import time
+from typing import List, Sequence, Tuple
+
+from transformers import AutoTokenizer
+
+from embedding_batching import plan_batches
+
+# ===== 可調參數 =====
+DEFAULT_TOKEN_BUDGET = 32768
+DEFAULT_MAX_LENGTH = 512
+
+
+class BulkReranker:
+    """把多條指引、多家公司的 (Definition, chunk) 配對一次收齊後再送進 cross-encoder。
+
+    相同配對只算一次；依 token 長度排序後以 token 預算組批，算完再依原順序放回。
+    """
+
+    def __init__(
+        self,
+        reranker,
+        model_name: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        cache=None,
+    ):
+        self.reranker = reranker
+        self.cache = cache
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.token_budget = token_budget
+        self.max_length = max_length
+        self.stats = {"pairs": 0, "scored": 0, "duplicates": 0, "seconds": 0.0}
+
+    def pair_lengths(self, pairs: Sequence[Tuple[str, str]]) -> List[int]:
+        enc = self.tokenizer(
+            [q for q, _ in pairs],
+            [p for _, p in pairs],
+            truncation=True,
+            max_length=self.max_length,
+        )
+        return [len(x) for x in enc["input_ids"]]
+
+    def _compute(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        scores = self.reranker.compute_score(
+            [list(p) for p in pairs],
+            batch_size=len(pairs),
+            max_length=self.max_length,
+            normalize=True,
+        )
+        # 只有一組配對時 FlagReranker 回傳純量
+        if not isinstance(scores, (list, tuple)):
+            scores = [scores]
+        return [float(s) for s in scores]
+
+    def score_unique(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """為已去重的配對計分，依 token 預算組批。"""
+        if not pairs:
+            return []
+        lengths = self.pair_lengths(pairs)
+        out = [0.0] * len(pairs)
+        for batch in plan_batches(lengths, self.token_budget):
+            scores = self._compute([pairs[i] for i in batch])
+            for i, s in zip(batch, scores):
+                out[i] = s
+        return out
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        pairs = [(str(q), str(p)) for q, p in pairs]
+        unique = list(dict.fromkeys(pairs))
+        scores = {}
+        todo = unique
+        if self.cache is not None:
+            cached = self.cache.get_many(unique)
+            scores = {p: s for p, s in zip(unique, cached) if s is not None}
+            todo = [p for p, s in zip(unique, cached) if s is None]
+
+        t0 = time.perf_counter()
+        fresh = self.score_unique(todo)
+        self.stats["seconds"] += time.perf_counter() - t0
+        scores.update(zip(todo, fresh))
+        if self.cache is not None:
+            self.cache.put_many(todo, fresh)
+
+        self.stats["pairs"] += len(pairs)
+        self.stats["scored"] += len(todo)
+        self.stats["duplicates"] += len(pairs) - len(unique)
+        return [scores[p] for p in pairs]
+
+    def log_stats(self):
+        s = self.stats
+        if not s["pairs"]:
+            return
+        rate = s["scored"] / s["seconds"] if s["seconds"] else 0.0
+        print(
+            f"[INFO] rerank：{s['pairs']} 組配對，去除重複 {s['duplicates']} 組"
+            f"（{s['duplicates'] / s['pairs']:.1%}），實際計分 {s['scored']} 組，"
+            f"{rate:.1f} pairs/s"
+        )
+        if self.cache is not None:
+            self.cache.log_stats()
@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 正規化的檢索結果格式：
+#   {output_dir}/_dims/guidelines.parquet         label_key, Label, Definition, Point（所有公司共用）
+#   {output_dir}/_dims/chunks/{公司}.parquet       chunk_key, Chunk ID, 報告書頁數, Chunk Text
+#   {公司}_output_chunks.parquet                   事實表：Company, label_key, chunk_key, Rank, 分數及其他欄位
+# label_key / chunk_key 是內容雜湊：指引檔重排、報告書重新切塊後，舊事實表仍解回當時的文字；
+# 維度表只追加新鍵、不改既有列
+# 事實表的 schema metadata 記錄 dims 目錄的相對路徑，LLM 階段寫到子目錄的輸出也能找回維度表
+DIMS_DIR = "_dims"
+METADATA_KEY = b"result_store"
+
+GUIDELINE_COLUMNS = ["Label", "Definition", "Point"]
+CHUNK_COLUMNS = ["報告書頁數", "Chunk ID", "Chunk Text"]
+# 與 CSV 輸出相同的欄位順序
+RESULT_COLUMNS = [
+    "Company",
+    "Label",
+    "Definition",
+    "Point",
+    "報告書頁數",
+    "Chunk ID",
+    "Chunk Text",
+    "是否真的有揭露此標準?(Y/N)",
+    "reasoning",
+    "RerankScore",
+    "InitScoreOrDist",
+    "Rank",
+]
+_FACT_DTYPES = {
+    "Rank": "int16",
+    "RerankScore": "float32",
+    "InitScoreOrDist": "float32",
+}
+
+
+def content_key(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """以欄位內容的 blake2b 前 8 bytes 當鍵（int64）。"""
+    joined = df[columns].fillna("").astype(str).agg("\x1f".join, axis=1)
+    return joined.map(
+        lambda s: int.from_bytes(
+            hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little", signed=True
+        )
+    ).astype("int64")
+
+
+def _append_dim(path: str, key: str, rows: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """把還沒出現過的鍵追加進維度表，既有列不動；回傳更新後的維度表。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dim = (
+        pq.read_table(path).to_pandas()
+        if os.path.exists(path)
+        else pd.DataFrame(
+            {key: pd.Series(dtype="int64"), **{c: pd.Series(dtype=str) for c in columns}}
+        )
+    )
+    new = rows[~rows[key].isin(dim[key])].drop_duplicates(key)
+    if len(new):
+        dim = pd.concat([dim, new[[key] + columns]], ignore_index=True)
+        dim[key] = dim[key].astype("int64")
+        _write_atomic(pa.Table.from_pandas(dim, preserve_index=False), path)
+    return dim
+
+
+def _write_atomic(table: pa.Table, path: str):
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def guidelines_path(dims_dir: str) -> str:
+    return os.path.join(dims_dir, "guidelines.parquet")
+
+
+def chunks_path(dims_dir: str, company: str) -> str:
+    return os.path.join(dims_dir, "chunks", f"{company}.parquet")
+
+
+def write_guidelines(output_dir: str, guidelines):
+    """把指引追加進指引維度表，鍵為 Label + Definition + Point 的雜湊（與指引檔順序無關）。"""
+    df = pd.DataFrame(guidelines)[GUIDELINE_COLUMNS].fillna("").astype(str)
+    df.insert(0, "label_key", content_key(df, GUIDELINE_COLUMNS))
+    path = guidelines_path(os.path.join(output_dir, DIMS_DIR))
+    _append_dim(path, "label_key", df, GUIDELINE_COLUMNS)
+
+
+def write_results(df: pd.DataFrame, path: str, company: str, dims_dir: str):
+    """把寬表（與 CSV 相同欄位）拆成事實表寫入 path，文本只存在維度表裡一次。"""
+    fact = df.drop(columns=GUIDELINE_COLUMNS + CHUNK_COLUMNS, errors="ignore").copy()
+    if len(df):
+        label_keys = content_key(df, GUIDELINE_COLUMNS)
+        known = pq.read_table(guidelines_path(dims_dir), columns=["label_key"]).column(0)
+        missing = ~label_keys.isin(known.to_pylist())
+        if missing.any():
+            labels = sorted(df.loc[missing, "Label"].astype(str).unique())
+            raise ValueError(f"指引維度表缺少這些指引（Label/Definition/Point 不符）：{labels[:5]}")
+        chunks = df[CHUNK_COLUMNS].fillna("").astype(str)
+        chunks.insert(0, "chunk_key", content_key(chunks, CHUNK_COLUMNS))
+        # 同一公司的維度表只會由處理該公司的行程寫入
+        _append_dim(chunks_path(dims_dir, company), "chunk_key", chunks, CHUNK_COLUMNS)
+        fact.insert(1, "label_key", label_keys.values)
+        fact.insert(2, "chunk_key", chunks["chunk_key"].values)
+    else:
+        fact["label_key"] = pd.Series(dtype="int64")
+        fact["chunk_key"] = pd.Series(dtype="int64")
+    for col, dtype in _FACT_DTYPES.items():
+        if col in fact.columns:
+            fact[col] = pd.to_numeric(fact[col], errors="coerce").astype(dtype)
+    if "Company" in fact.columns:
+        fact["Company"] = fact["Company"].astype("category")
+
+    table = pa.Table.from_pandas(fact, preserve_index=False)
+    info = {
+        "company": company,
+        "dims_dir": os.path.relpath(dims_dir, os.path.dirname(os.path.abspath(path))),
+    }
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(info, ensure_ascii=False)}
+    )
+    _write_atomic(table, path)
+
+
+def write_records(records: List[dict], path: str, company: str, output_dir: str):
+    """query_all_report 的輸出列 → Parquet 事實表；維度表放在 output_dir/_dims。"""
+    df = pd.DataFrame(records, columns=RESULT_COLUMNS)
+    write_results(df, path, company, os.path.join(output_dir, DIMS_DIR))
+
+
+def read_info(path: str) -> dict:
+    meta = pq.read_schema(path).metadata or {}
+    info = json.loads(meta[METADATA_KEY]) if METADATA_KEY in meta else {}
+    dims_dir = info.get("dims_dir", DIMS_DIR)
+    base = os.path.dirname(os.path.abspath(path))
+    info["dims_dir"] = os.path.normpath(os.path.join(base, dims_dir))
+    return info
+
+
+def load_results(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """讀回與 CSV 相同欄位的寬表；CSV 直接讀。指定 columns 時只讀需要的事實欄位與維度表。"""
+    if not path.endswith(".parquet"):
+        return pd.read_csv(path, usecols=columns)
+
+    info = read_info(path)
+    fact_cols = pq.read_schema(path).names
+    if "label_id" in fact_cols:
+        raise ValueError(f"{path} 是以列位置當鍵的舊版格式，維度表可能已變動，請重新輸出")
+    dim_cols = GUIDELINE_COLUMNS + CHUNK_COLUMNS
+    if columns is None:
+        wanted = [c for c in RESULT_COLUMNS if c in fact_cols or c in dim_cols]
+        wanted += [
+            c for c in fact_cols if c not in wanted and c not in ("label_key", "chunk_key")
+        ]
+    else:
+        wanted = list(columns)
+    need_guideline = any(c in GUIDELINE_COLUMNS for c in wanted)
+    need_chunk = any(c in CHUNK_COLUMNS for c in wanted)
+
+    read_cols = [c for c in wanted if c in fact_cols]
+    if need_guideline:
+        read_cols.append("label_key")
+    if need_chunk:
+        read_cols.append("chunk_key")
+    df = pq.read_table(path, columns=read_cols).to_pandas()
+    if "Company" in df.columns:
+        df["Company"] = df["Company"].astype(str)
+
+    if need_guideline:
+        g = pq.read_table(guidelines_path(info["dims_dir"])).to_pandas()
+        g = g.drop_duplicates("label_key").set_index("label_key")
+        for c in GUIDELINE_COLUMNS:
+            if c in wanted:
+                df[c] = df["label_key"].map(g[c])
+    if need_chunk:
+        ch = pq.read_table(chunks_path(info["dims_dir"], info["company"])).to_pandas()
+        ch = ch.drop_duplicates("chunk_key").set_index("chunk_key")
+        for c in CHUNK_COLUMNS:
+            if c in wanted:
+                df[c] = df["chunk_key"].map(ch[c])
+    return df[wanted]
+
+
+def dims_dir_of(path: str) -> str:
+    """LLM 階段寫出新的事實表時沿用輸入檔的維度表。"""
+    return read_info(path)["dims_dir"]
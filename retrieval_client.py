@@ -0,0 +1,55 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import List, Optional
+
+# ===== 可調參數 =====
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765"
+# rerank 大量公司時可能需要數分鐘
+DEFAULT_TIMEOUT = 1800
+
+
+class RetrievalClient:
+    """retrieval_server.py 的精簡用戶端，只用標準函式庫。"""
+
+    def __init__(self, url: str = DEFAULT_SERVER_URL, timeout: float = DEFAULT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: Optional[dict] = None) -> dict:
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        req = urllib.request.Request(self.url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            detail = json.loads(e.read() or b"{}").get("error", "")
+            raise RuntimeError(f"檢索服務回傳 {e.code}：{detail}") from e
+
+    def stats(self) -> dict:
+        return self._request("/stats")
+
+    def query(
+        self,
+        companies: List[str],
+        guidelines: Optional[List[dict]] = None,
+        candidate_k: Optional[int] = None,
+        top_n: Optional[int] = None,
+    ) -> dict:
+        """回傳 {"results": {公司: 輸出列}, "timing": {...}, "round_trip_s": ...}。"""
+        payload = {"companies": list(companies)}
+        if guidelines is not None:
+            payload["guidelines"] = guidelines
+        if candidate_k:
+            payload["candidate_k"] = candidate_k
+        if top_n:
+            payload["top_n"] = top_n
+        t0 = time.perf_counter()
+        resp = self._request("/query", payload)
+        resp["round_trip_s"] = time.perf_counter() - t0
+        return resp
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+from dotenv import load_dotenv
+
+from query_all_report import (
+    BASE_CHROMA_PATH,
+    GUIDELINES_PATH,
+    INDEX_BACKEND,
+    TOP_N,
+    CompanyJob,
+    build_output_records,
+    embed_guidelines,
+    load_guidelines,
+    load_models,
+    open_report_store,
+    rerank_group,
+    retrieve_candidates,
+)
+
+# ===== 可調參數 =====
+# 常駐檢索服務：模型與指引 embedding 只載入一次，報告書向量庫依需求開啟並以 LRU 保留
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+MAX_OPEN_STORES = 8
+# 保留最近多少筆請求的延遲，用於 /stats 的 p50 / p95
+LATENCY_WINDOW = 1000
+
+
+class BadRequest(ValueError):
+    """請求內容不合法，回 400。"""
+
+
+class StoreNotFound(KeyError):
+    """找不到公司的向量庫，回 404。"""
+
+
+def close_store(db):
+    """釋放被淘汰的向量庫。
+
+    chromadb 依路徑快取 System（含已載入的 HNSW 索引），只丟掉 Python 參考不會釋放記憶體，
+    需從 SharedSystemClient 的快取移除並 stop()。MatrixIndex 的 memmap 隨參考消失即釋放。
+    """
+    client = getattr(db, "_client", None)
+    if client is None:
+        return
+    systems = getattr(type(client), "_identifer_to_system", None)
+    identifier = getattr(client, "_identifier", None)
+    if systems is None or identifier is None:
+        print("[WARN] 此版本的 chromadb 無法個別關閉向量庫，淘汰後記憶體不會釋放")
+        return
+    system = systems.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
+
+class StoreLRU:
+    """最多同時開著 max_open 個報告書向量庫，超過時關掉最久沒用的（見 close_store）。"""
+
+    def __init__(self, base_path: str, embeddings, max_open: int = MAX_OPEN_STORES):
+        self.base_path = base_path
+        self.embeddings = embeddings
+        self.max_open = max_open
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, company: str):
+        store_dir = os.path.join(self.base_path, company)
+        if not os.path.isdir(store_dir):
+            raise StoreNotFound(f"找不到 {company} 的向量庫：{store_dir}")
+        with self._lock:
+            if company in self._stores:
+                self._stores.move_to_end(company)
+                return self._stores[company], store_dir, False
+            db = open_report_store(store_dir, self.embeddings)
+            self._stores[company] = db
+            while len(self._stores) > self.max_open:
+                # 查詢都在 RetrievalService._infer_lock 內進行，被淘汰的向量庫此時沒有人在用
+                _, evicted = self._stores.popitem(last=False)
+                close_store(evicted)
+            return db, store_dir, True
+
+    def names(self):
+        with self._lock:
+            return list(self._stores)
+
+
+class RetrievalService:
+    def __init__(self, device: str):
+        t0 = time.perf_counter()
+        self.embeddings, self.reranker, load_sec = load_models(device)
+        self.guidelines = load_guidelines(GUIDELINES_PATH)
+        t1 = time.perf_counter()
+        self.guideline_vectors = embed_guidelines(self.embeddings, self.guidelines)
+        self.startup = {
+            "model_load_s": load_sec,
+            "guideline_embed_s": time.perf_counter() - t1,
+            "total_s": time.perf_counter() - t0,
+        }
+        self.stores = StoreLRU(BASE_CHROMA_PATH, self.embeddings)
+        # 模型推論一次只跑一個請求，避免多執行緒搶同一個 GPU / CPU
+        self._infer_lock = threading.Lock()
+        self._latencies = []
+        self.requests = 0
+
+    @staticmethod
+    def parse_payload(payload) -> tuple:
+        """檢查請求內容，回傳 (companies, guidelines 或 None, candidate_k, top_n)；不合法時拋 BadRequest。"""
+        if not isinstance(payload, dict):
+            raise BadRequest("請求內容需為 JSON 物件")
+        companies = payload.get("companies")
+        if companies is None and payload.get("company"):
+            companies = [payload["company"]]
+        if (
+            not isinstance(companies, list)
+            or not companies
+            or not all(isinstance(c, str) and c for c in companies)
+        ):
+            raise BadRequest("需提供 companies（非空字串清單）或 company")
+        guidelines = payload.get("guidelines")
+        if guidelines is not None and (
+            not isinstance(guidelines, list)
+            or not all(isinstance(g, dict) and g.get("Definition") for g in guidelines)
+        ):
+            raise BadRequest("guidelines 需為清單，且每條都要有 Definition")
+        try:
+            top_n = int(payload.get("top_n", TOP_N))
+            candidate_k = payload.get("candidate_k")
+            candidate_k = int(candidate_k) if candidate_k else None
+        except (TypeError, ValueError):
+            raise BadRequest("top_n / candidate_k 需為整數")
+        if top_n < 1 or (candidate_k is not None and candidate_k < 1):
+            raise BadRequest("top_n / candidate_k 需為正整數")
+        return companies, guidelines or None, candidate_k, top_n
+
+    def query(self, payload: dict) -> dict:
+        """payload：companies（或 company）、guidelines（選填，預設指引檔）、candidate_k、top_n。"""
+        timing = {}
+        t_start = time.perf_counter()
+        companies, custom_guidelines, candidate_k, top_n = self.parse_payload(payload)
+
+        with self._infer_lock:
+            t0 = time.perf_counter()
+            if custom_guidelines:
+                guidelines = [
+                    {
+                        "Label": g.get("Label", ""),
+                        "Definition": g["Definition"],
+                        "Point": g.get("Point", ""),
+                    }
+                    for g in custom_guidelines
+                ]
+                vectors = embed_guidelines(self.embeddings, guidelines)
+            else:
+                guidelines, vectors = self.guidelines, self.guideline_vectors
+            timing["embed_s"] = time.perf_counter() - t0
+
+            jobs, opened = [], []
+            timing["open_s"] = timing["retrieve_s"] = 0.0
+            for company in companies:
+                t0 = time.perf_counter()
+                db, store_dir, is_new = self.stores.get(company)
+                timing["open_s"] += time.perf_counter() - t0
+                if is_new:
+                    opened.append(company)
+                t0 = time.perf_counter()
+                batch = retrieve_candidates(
+                    db, store_dir, guidelines, vectors, candidate_k=candidate_k
+                )
+                timing["retrieve_s"] += time.perf_counter() - t0
+                jobs.append(CompanyJob(company, None, batch, 0.0))
+
+            t0 = time.perf_counter()
+            per_job, _ = rerank_group(jobs, guidelines, self.reranker)
+            timing["rerank_s"] = time.perf_counter() - t0
+
+        results = {
+            job.company_name: build_output_records(
+                job.company_name, guidelines, job.batch, scores, top_n=top_n
+            )
+            for job, scores in zip(jobs, per_job)
+        }
+        timing["total_s"] = time.perf_counter() - t_start
+        self.requests += 1
+        self._latencies = (self._latencies + [timing["total_s"]])[-LATENCY_WINDOW:]
+        print(
+            f"[INFO] 請求 #{self.requests}：{len(companies)} 家公司 × {len(guidelines)} 條指引，"
+            + "，".join(f"{k} {v:.2f}s" for k, v in timing.items())
+            + (f"；新開啟 {opened}" if opened else "")
+        )
+        return {"results": results, "timing": timing, "opened_stores": opened}
+
+    def stats(self) -> dict:
+        lat = self._latencies
+        return {
+            "status": "ok",
+            "index_backend": INDEX_BACKEND,
+            "startup": self.startup,
+            "requests": self.requests,
+            "latency_p50_s": float(np.percentile(lat, 50)) if lat else None,
+            "latency_p95_s": float(np.percentile(lat, 95)) if lat else None,
+            "open_stores": self.stores.names(),
+        }
+
+
+def make_handler(service: RetrievalService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: dict):
+            raw = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path in ("/health", "/stats"):
+                self._send(200, service.stats())
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/query":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                self._send(200, service.query(payload))
+            except json.JSONDecodeError as e:
+                self._send(400, {"error": f"JSON 格式錯誤：{e}"})
+            except BadRequest as e:
+                self._send(400, {"error": str(e)})
+            except StoreNotFound as e:
+                self._send(404, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            # 每筆請求已在 RetrievalService.query 印出延遲
+            pass
+
+    return Handler
+
+
+def main():
+    load_dotenv()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"[INFO] Using device: {device}")
+    service = RetrievalService(device)
+    s = service.startup
+    print(
+        f"[INFO] 啟動完成：模型載入 {s['model_load_s']:.1f}s，"
+        f"{len(service.guidelines)} 條指引 embedding {s['guideline_embed_s']:.1f}s，"
+        f"共 {s['total_s']:.1f}s"
+    )
+    server = ThreadingHTTPServer((SERVER_HOST, SERVER_PORT), make_handler(service))
+    print(
+        f"[SUCCESS] 檢索服務已啟動：http://{SERVER_HOST}:{SERVER_PORT}"
+        f"（POST /query，GET /stats）"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.reranker.log_stats()
+
+
+if __name__ == "__main__":
+    main()
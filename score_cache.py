@@ -0,0 +1,123 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# ===== 可調參數 =====
+DEFAULT_CACHE_PATH = "rerank_score_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 2_000_000
+# 超過上限時多淘汰一些，避免每次寫入都觸發淘汰
+EVICT_FRACTION = 0.05
+_SQLITE_MAX_VARS = 900
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """以 (reranker 模型, Definition 雜湊, chunk 雜湊) 為鍵的 rerank 分數快取，依最後使用時間淘汰。"""
+
+    def __init__(
+        self,
+        model_id: str,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=60, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "model TEXT NOT NULL, query_hash TEXT NOT NULL, passage_hash TEXT NOT NULL, "
+            "score REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, query_hash, passage_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scores_lru ON scores(last_used)"
+        )
+
+    def _keys(self, pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        return [(text_hash(q), text_hash(p)) for q, p in pairs]
+
+    def get_many(self, pairs: List[Tuple[str, str]]) -> List[Optional[float]]:
+        keys = self._keys(pairs)
+        found: Dict[Tuple[str, str], float] = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQLITE_MAX_VARS // 2):
+                part = keys[i : i + _SQLITE_MAX_VARS // 2]
+                cond = " OR ".join(["(query_hash = ? AND passage_hash = ?)"] * len(part))
+                rows = self._conn.execute(
+                    f"SELECT query_hash, passage_hash, score FROM scores "
+                    f"WHERE model = ? AND ({cond})",
+                    [self.model_id] + [h for key in part for h in key],
+                ).fetchall()
+                found.update({(q, p): s for q, p, s in rows})
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE scores SET last_used = ? "
+                    "WHERE model = ? AND query_hash = ? AND passage_hash = ?",
+                    [(now, self.model_id, q, p) for q, p in found],
+                )
+        out = [found.get(k) for k in keys]
+        hit = sum(s is not None for s in out)
+        self.hits += hit
+        self.misses += len(out) - hit
+        return out
+
+    def put_many(self, pairs: List[Tuple[str, str]], scores: List[float]):
+        if not pairs:
+            return
+        now = time.time()
+        rows = [
+            (self.model_id, q, p, float(s), now)
+            for (q, p), s in zip(self._keys(pairs), scores)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        n = count - self.max_entries + int(self.max_entries * EVICT_FRACTION)
+        self._conn.execute(
+            "DELETE FROM scores WHERE rowid IN "
+            "(SELECT rowid FROM scores ORDER BY last_used LIMIT ?)",
+            (n,),
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        entries = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        print(
+            f"[INFO] rerank 分數快取：命中 {s['hits']}、未命中 {s['misses']}"
+            f"（命中率 {s['hit_rate']:.1%}），已存 {s['entries']}/{s['max_entries']} 筆"
+        )
@@ -0,0 +1,119 @@
+import os
+import time
+import pandas as pd
+from dotenv import load_dotenv
+from tqdm.auto import tqdm
+
+from create_all_db import (
+    BASE_STORE_PATH,
+    PDF_ROOT,
+    find_all_pdfs,
+    iter_chunk_windows,
+    iter_pdf_pages,
+    load_embeddings,
+    log_embedding_stats,
+    open_report_writer,
+)
+
+# ===== 可調參數 =====
+# 每組 (CHUNK_SIZE, CHUNK_OVERLAP) 各產生一套文本塊；頁面文字只從快取讀一次
+SWEEP_PAIRS = [(300, 30), (500, 50), (800, 80), (1000, 100)]
+SWEEP_BASE_PATH = f"{BASE_STORE_PATH}_sweep"
+# True：每組參數都 embed 並建好可供 query_all_report.py 查詢的向量庫
+SWEEP_BUILD_INDEX = True
+
+
+def pair_dir(chunk_size: int, chunk_overlap: int) -> str:
+    return os.path.join(SWEEP_BASE_PATH, f"cs{chunk_size}_co{chunk_overlap}")
+
+
+def main():
+    load_dotenv()
+    pdf_paths = find_all_pdfs(PDF_ROOT)
+    if not pdf_paths:
+        print(f"[ERROR] 在 {PDF_ROOT} 找不到任何 PDF。")
+        return
+    embeddings = load_embeddings() if SWEEP_BUILD_INDEX else None
+
+    rows = []
+    for pdf_path in tqdm(pdf_paths, desc="chunking sweep"):
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        t0 = time.perf_counter()
+        pages = list(iter_pdf_pages(pdf_path))
+        load_sec = time.perf_counter() - t0
+
+        for chunk_size, chunk_overlap in SWEEP_PAIRS:
+            out_dir = pair_dir(chunk_size, chunk_overlap)
+            os.makedirs(out_dir, exist_ok=True)
+            t0 = time.perf_counter()
+            documents = []
+            for window_docs, _ in iter_chunk_windows(
+                pdf_path,
+                window_pages=max(len(pages), 1),
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                pages=pages,
+            ):
+                documents.extend(window_docs)
+            split_sec = time.perf_counter() - t0
+
+            pd.DataFrame(
+                {
+                    "page": [d.metadata["page"] for d in documents],
+                    "chunk_id": [d.metadata["chunk_id"] for d in documents],
+                    "text": [d.page_content for d in documents],
+                }
+            ).to_parquet(os.path.join(out_dir, f"{pdf_name}.chunks.parquet"))
+
+            embed_sec = 0.0
+            if SWEEP_BUILD_INDEX and documents:
+                t0 = time.perf_counter()
+                vectors = embeddings.embed_documents(
+                    [d.page_content for d in documents]
+                )
+                writer = open_report_writer(os.path.join(out_dir, pdf_name))
+                writer.add(documents, vectors)
+                writer.close()
+                embed_sec = time.perf_counter() - t0
+
+            rows.append(
+                {
+                    "PDF": pdf_name,
+                    "chunk_size": chunk_size,
+                    "chunk_overlap": chunk_overlap,
+                    "pages": len(pages),
+                    "chunks": len(documents),
+                    "mean_chunk_chars": (
+                        sum(len(d.page_content) for d in documents) / len(documents)
+                        if documents
+                        else 0
+                    ),
+                    "page_load_sec": load_sec,
+                    "split_sec": split_sec,
+                    "embed_and_write_sec": embed_sec,
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    os.makedirs(SWEEP_BASE_PATH, exist_ok=True)
+    out_csv = os.path.join(SWEEP_BASE_PATH, "sweep_summary.csv")
+    df.to_csv(out_csv, index=False, encoding="utf-8-sig")
+    print(
+        df.groupby(["chunk_size", "chunk_overlap"])
+        .agg(
+            {
+                "chunks": "sum",
+                "mean_chunk_chars": "mean",
+                "split_sec": "sum",
+                "embed_and_write_sec": "sum",
+            }
+        )
+        .to_string()
+    )
+    if embeddings is not None:
+        log_embedding_stats(embeddings)
+    print(f"[SUCCESS] 輸出：{out_csv}")
+
+
+if __name__ == "__main__":
+    main()